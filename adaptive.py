@@ -0,0 +1,87 @@
+# adaptive.py
+
+import datetime
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Products are never re-checked more often than this (seconds)
+CHECK_INTERVAL_MIN = float(os.getenv("CHECK_INTERVAL_MIN", 600))
+# Products whose price never moves are still re-checked this often (seconds)
+CHECK_INTERVAL_MAX = float(os.getenv("CHECK_INTERVAL_MAX", 86400))
+# Upper bound for the failure backoff (seconds)
+FAILURE_BACKOFF_MAX = float(os.getenv("FAILURE_BACKOFF_MAX", 21600))
+# Expected price changes a single-tracker product may miss between two checks;
+# lower values check more often
+STALENESS_BUDGET = float(os.getenv("STALENESS_BUDGET", 0.3))
+# The budget is divided by trackers ** TRACKER_WEIGHT, so products several people track
+# stay near CHECK_INTERVAL_MIN even when their price rarely moves
+TRACKER_WEIGHT = float(os.getenv("TRACKER_WEIGHT", 2))
+# Observations lose half their weight in the volatility estimate after this many seconds
+VOLATILITY_HALF_LIFE = float(os.getenv("VOLATILITY_HALF_LIFE", 7 * 86400))
+
+# Assumed history of a product nobody has checked yet: 4 changes a day, worth 6 hours of observation
+DEFAULT_VOLATILITY = {"changes": 1.0, "seconds": 6 * 3600.0}
+
+
+def update_volatility(volatility, changed, elapsed):
+    """Fold one check into a product's exponentially decayed change count and observed time."""
+    volatility = volatility or DEFAULT_VOLATILITY
+    decay = 0.5 ** (elapsed / VOLATILITY_HALF_LIFE)
+    return {
+        "changes": volatility["changes"] * decay + (1.0 if changed else 0.0),
+        "seconds": volatility["seconds"] * decay + elapsed,
+    }
+
+
+def change_rate(volatility):
+    """Estimated price changes per second."""
+    volatility = volatility or DEFAULT_VOLATILITY
+    return volatility["changes"] / max(volatility["seconds"], 1.0)
+
+
+def next_check_delay(volatility, trackers=1, failures=0):
+    """Seconds until a product should be checked again.
+
+    The interval is chosen so that a product accumulates about STALENESS_BUDGET price
+    changes between checks, divided by trackers ** TRACKER_WEIGHT: a missed change costs
+    every tracker, so popular products are checked far more often. Consecutive failures
+    switch to exponential backoff instead.
+    """
+    if failures:
+        return min(FAILURE_BACKOFF_MAX, CHECK_INTERVAL_MIN * 2 ** min(failures, 16))
+
+    popularity = max(trackers or 0, 1) ** TRACKER_WEIGHT
+    rate = change_rate(volatility)
+    interval = STALENESS_BUDGET / (rate * popularity) if rate > 0 else CHECK_INTERVAL_MAX
+    return min(CHECK_INTERVAL_MAX, max(CHECK_INTERVAL_MIN, interval))
+
+
+def schedule_fields(product, changed=False, failed=False, now=None):
+    """The $set fields that reschedule a product after a check."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    volatility = product.get("volatility") or DEFAULT_VOLATILITY
+    failures = product.get("failures", 0) + 1 if failed else 0
+
+    if not failed:
+        last_checked_at = product.get("last_checked_at")
+        if last_checked_at is None:
+            elapsed = CHECK_INTERVAL_MIN  # Products from the fixed schedule were checked every interval
+        else:
+            if last_checked_at.tzinfo is None:  # Motor returns naive UTC datetimes
+                last_checked_at = last_checked_at.replace(tzinfo=datetime.timezone.utc)
+            elapsed = max((now - last_checked_at).total_seconds(), 1.0)
+        volatility = update_volatility(volatility, changed, elapsed)
+
+    delay = next_check_delay(volatility, product.get("trackers", 1), failures)
+    fields = {
+        "volatility": volatility,
+        "failures": failures,
+        "next_check_at": now + datetime.timedelta(seconds=delay),
+    }
+    if not failed:
+        fields["last_checked_at"] = now
+    return fields
+
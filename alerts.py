@@ -0,0 +1,213 @@
+# alerts.py
+
+import asyncio
+import logging
+import os
+import time
+from dotenv import load_dotenv
+from helpers import (
+    PRODUCTS, fetch_alert_subscribers, fetch_digest_users,
+    queue_digest_entries, claim_digest_entries, delete_digest_entries,
+)
+from dispatcher import get_dispatcher
+from jobs import JOB_LEASE_SECONDS
+from prices import is_available
+
+load_dotenv()
+
+# Seconds between two digests; changes for digest-mode users are queued in Mongo until then
+DIGEST_INTERVAL = float(os.getenv("DIGEST_INTERVAL", 3600))
+
+
+# Alert templates, filled with str.format(**fields) once per changed product
+ALERT_TEMPLATES = {
+    "increased": (
+        "🚨 The price of **{name}** has **increased** by ₹{change}.\n"
+        "   - Previous Price: ₹{previous_price}\n"
+        "   - Current Price: ₹{price}\n"
+        "   - [Check it out here]({url})"
+    ),
+    "decreased": (
+        "🎉 The price of **{name}** has **decreased** by ₹{change}.\n"
+        "   - Previous Price: ₹{previous_price}\n"
+        "   - Current Price: ₹{price}\n"
+        "   - [Check it out here]({url})"
+    ),
+    "out_of_stock": (
+        "⚠️ **{name}** is **out of stock**.\n"
+        "   - Last Price: ₹{previous_price}\n"
+        "   - [Check it out here]({url})"
+    ),
+}
+
+DIGEST_HEADER = "🛒 **{count} of your tracked products changed price:**\n\n"
+DIGEST_LINES = {
+    "increased": "🚨 [{name}]({url}): ₹{previous_price} → ₹{price} (+₹{change})\n",
+    "decreased": "🎉 [{name}]({url}): ₹{previous_price} → ₹{price} (-₹{change})\n",
+    "out_of_stock": "⚠️ [{name}]({url}): out of stock (was ₹{previous_price})\n",
+}
+
+# Telegram rejects messages above 4096 characters
+MAX_MESSAGE_LENGTH = 4000
+
+
+def calculate_price_change(product):
+    """Calculate the absolute price change and determine if the price increased or decreased."""
+    try:
+        # Convert price and previous_price to floats for arithmetic operation
+        current_price = float(product["price"])
+        previous_price = float(product["previous_price"])
+
+        # Calculate the absolute change
+        price_difference = current_price - previous_price
+
+        # Determine if price increased or decreased
+        if price_difference > 0:
+            return abs(price_difference), "increased"
+        elif price_difference < 0:
+            return abs(price_difference), "decreased"
+        else:
+            return 0, "no change"  # No change in price
+
+    except (ValueError, TypeError) as e:
+        logging.error("Error calculating price change: %s", e)
+        return 0, "error"
+
+
+def _fields(product):
+    price_change, change_type = calculate_price_change(product)
+    if price_change <= 0:
+        return None, None
+    if change_type == "decreased" and not is_available(float(product["price"])):
+        change_type = "out_of_stock"
+    fields = {
+        "name": product["product_name"],
+        "change": f"{price_change:g}",
+        "previous_price": product["previous_price"],
+        "price": product["price"],
+        "url": product["affiliate_url"],
+    }
+    return change_type, fields
+
+
+class RenderedAlert:
+    """A changed product with its alert text and digest line, rendered once and shared by all subscribers."""
+
+    def __init__(self, product, change_type, fields):
+        self.product = product
+        self.change_type = change_type
+        self.text = ALERT_TEMPLATES[change_type].format(**fields)
+        self.digest_line = DIGEST_LINES[change_type].format(**fields)
+
+
+def render_alert(product):
+    """Render a product's price-change alert, or None when the price did not move."""
+    change_type, fields = _fields(product)
+    if change_type is None:
+        return None
+    return RenderedAlert(product, change_type, fields)
+
+
+def render_digest(alerts):
+    """Combine one user's alerts into as few messages as Telegram's length limit allows."""
+    messages = []
+    current = DIGEST_HEADER.format(count=len(alerts))
+    for alert in alerts:
+        if len(current) + len(alert.digest_line) > MAX_MESSAGE_LENGTH:
+            messages.append(current)
+            current = ""
+        current += alert.digest_line
+    if current:
+        messages.append(current)
+    return messages
+
+
+async def notify_users(changed_products, app):
+    """Notify users of price changes.
+
+    Users in instant mode get one alert per product. For digest-mode users the
+    changes are queued and sent as one summary by `send_digests`.
+    """
+    if not changed_products:
+        return
+
+    # One query for the changed products and one for the trackers whose thresholds they cross
+    global_products = await PRODUCTS.find({"_id": {"$in": changed_products}}).to_list(length=None)
+
+    # Each alert is rendered once and shared by every subscriber of the product
+    alerts = [alert for alert in map(render_alert, global_products) if alert]
+    subscribers = await fetch_alert_subscribers(
+        (alert.product["_id"], float(alert.product["previous_price"]), float(alert.product["price"]))
+        for alert in alerts
+    )
+    digest_users = await fetch_digest_users(
+        {user_id for alert in alerts for user_id in subscribers.get(alert.product["_id"], [])}
+    )
+
+    # Queued on the shared dispatcher: rate limited, FloodWait aware, failures don't stop the fan-out
+    outbox = get_dispatcher(app)
+    deliveries = []
+    queued = []
+    for alert in alerts:
+        instant_users = []
+        for user_id in subscribers.get(alert.product["_id"], []):
+            if user_id in digest_users:
+                queued.append((user_id, alert.product))
+            else:
+                instant_users.append(user_id)
+        if instant_users:
+            deliveries.append(outbox.send_many(instant_users, alert.text, tag="alert", disable_web_page_preview=True))
+
+    await queue_digest_entries(queued)
+    results = await asyncio.gather(*deliveries)
+    delivered = sum(ok for ok, _ in results)
+    failed = sum(failed for _, failed in results)
+    logging.info("Price alerts: %s delivered, %s failed (%s queued for digests)", delivered, failed, len(queued))
+
+
+async def send_digests(app):
+    """Send every digest-mode user one summary of the changes queued since their last digest."""
+    claim, entries = await claim_digest_entries(JOB_LEASE_SECONDS)
+    if not entries:
+        return 0
+
+    # Entries arrive oldest first; two for the same product (left behind by a flush that died)
+    # become one line from the first previous price to the latest price
+    changes = {}
+    for entry in entries:
+        products = changes.setdefault(entry["user_id"], {})
+        earlier = products.get(entry["product_id"])
+        products[entry["product_id"]] = {**entry, "previous_price": earlier["previous_price"]} if earlier else entry
+
+    outbox = get_dispatcher(app)
+    deliveries = []
+    digests = 0
+    for user_id, products in changes.items():
+        # A product back at its earlier price renders no line
+        user_alerts = [alert for alert in map(render_alert, products.values()) if alert]
+        if not user_alerts:
+            continue
+        digests += 1
+        for text in render_digest(user_alerts):
+            deliveries.append(outbox.send_many([user_id], text, tag="digest", disable_web_page_preview=True))
+
+    results = await asyncio.gather(*deliveries)
+    await delete_digest_entries(claim)
+    delivered = sum(ok for ok, _ in results)
+    failed = sum(failed for _, failed in results)
+    logging.info("Digests: %s users, %s delivered, %s failed", digests, delivered, failed)
+    return digests
+
+
+async def send_digests_forever(app):
+    """Send the queued digests every DIGEST_INTERVAL seconds.
+
+    Flushes fall on multiples of the interval, so processes running this side by side
+    flush at the same moments and the first one takes every queued entry.
+    """
+    while True:
+        await asyncio.sleep(DIGEST_INTERVAL - time.time() % DIGEST_INTERVAL)
+        try:
+            await send_digests(app)
+        except Exception as e:
+            logging.error("Error sending digests: %s", e)
@@ -3,35 +3,45 @@
 from python_amazon_scraper import ExtractAmazon
 import logging
 import asyncio
-from tenacity import retry, stop_after_attempt, wait_exponential
+from executor import run_blocking
+import resilience
+from resilience import TransientScrapeError, PermanentScrapeError, BlockedError, looks_blocked
+from fetcher import extractor_from_html
 
-# Custom exception definitions
-class NetworkError(Exception):
+# Custom exception definitions, classified for resilience.call
+class NetworkError(TransientScrapeError):
     pass
 
-class ParsingError(Exception):
+class ParsingError(PermanentScrapeError):
     pass
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+# Blocking extraction, runs on the scrape pool (see executor.py); parses `html` when it was already fetched
+def extract_product(url, html=None):
+    product = ExtractAmazon(url) if html is None else extractor_from_html(ExtractAmazon, html)
+    product_name = product.get_title()
+    if not product_name:
+        # The scraper returns blanks instead of failing; a page without a title is no product page
+        if looks_blocked(product.soup):
+            raise BlockedError(f"Amazon served a block page for {url}")
+        raise ParsingError(f"No product title found on {url}")
+    price = product.get_price()
+    is_available = product.is_available()
+    images = product.get_images()
+    image_url = images if images else None
+    return price, product_name, is_available, image_url
+
+
+# Retries transient failures within the sweep's retry budget; fails fast while Amazon's circuit is open
 async def track_prices(url):
     try:
-        product = ExtractAmazon(url)
-        product_name = product.get_title()
-        price = product.get_price()
-        is_available = product.is_available()
-        images = product.get_images()
-
-        logging.info(f"Product Images = {images}")
-        image_url = images if images else None
-        return price, product_name, is_available, image_url
-
-    except NetworkError as e:
-        logging.error(f"Network error while scraping Amazon: {e}")
-        raise  # Reraise to retry on network failure
-    except ParsingError as e:
-        logging.error(f"Error parsing product details: {e}")
-        raise  # Retry on parsing errors
+        return await resilience.call("amazon", run_blocking, extract_product, url)
+
+    except resilience.CircuitOpenError:
+        raise  # Not a failure of this product
+    except PermanentScrapeError as e:
+        logging.error("Error parsing product details: %s", e)
+        raise
     except Exception as e:
-        logging.error(f"Unknown error scraping product from Amazon: {e}")
-        raise  # Reraise for unknown errors to trigger retry
+        logging.error("Error scraping product from Amazon: %s", e)
+        raise
@@ -1,4 +1,7 @@
-from flask import Flask
+from flask import Flask, Response
+import threading
+from werkzeug.serving import make_server
+import metrics
 
 app = Flask(__name__)
 
@@ -8,6 +11,17 @@ def hello_world():
     return "Jai Shree Ram."
 
 
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def serve_in_background(port, host="0.0.0.0"):
+    """Serve this app from a daemon thread next to the bot's event loop."""
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
 if __name__ == "__main__":
     app.run()
-
@@ -0,0 +1,138 @@
+# benchmarks/bench_adaptive.py
+#
+# Simulates a week of synthetic price histories and compares the fixed 10 minute
+# sweep with the adaptive scheduler: how many scrapes each needs and how long a
+# price change goes unnoticed. Hot and warm products (3+ trackers) should stay near
+# the fixed sweep's delay; the savings come from rarely changing, little tracked ones.
+# Run from the repository root:
+#
+#   python benchmarks/bench_adaptive.py --products 1000 --days 7
+
+import argparse
+import bisect
+import heapq
+import itertools
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adaptive import CHECK_INTERVAL_MIN, next_check_delay, update_volatility  # noqa: E402
+
+# name: (share of catalogue, mean hours between price changes, tracker range)
+PROFILES = {
+    "hot": (0.05, 2, (20, 200)),
+    "warm": (0.25, 24, (3, 20)),
+    "cold": (0.70, 24 * 30, (1, 3)),
+}
+
+
+class DueQueue:
+    """In-memory priority queue of (due time, item), earliest first; stands in for the next_check_at index."""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+
+    def push(self, due_at, item):
+        heapq.heappush(self._heap, (due_at, next(self._counter), item))
+
+    def next_due(self):
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+
+def make_catalogue(count, horizon, rng):
+    catalogue = []
+    for kind, (share, mean_hours, (low, high)) in PROFILES.items():
+        for _ in range(int(count * share)):
+            changes, t = [], 0.0
+            while True:
+                t += rng.expovariate(1 / (mean_hours * 3600))
+                if t >= horizon:
+                    break
+                changes.append(t)
+            catalogue.append({"kind": kind, "trackers": rng.randint(low, high), "changes": changes})
+    return catalogue
+
+
+def changed_between(product, start, end):
+    changes = product["changes"]
+    return bisect.bisect_right(changes, end) > bisect.bisect_right(changes, start)
+
+
+def record_detections(product, start, end, delays):
+    changes = product["changes"]
+    for change in changes[bisect.bisect_right(changes, start):bisect.bisect_right(changes, end)]:
+        delays[product["kind"]].append((end - change, product["trackers"]))
+
+
+def simulate_fixed(catalogue, horizon, interval):
+    delays = {kind: [] for kind in PROFILES}
+    scrapes = 0
+    for product in catalogue:
+        last = 0.0
+        t = interval
+        while t <= horizon:
+            scrapes += 1
+            record_detections(product, last, t, delays)
+            last, t = t, t + interval
+    return scrapes, delays
+
+
+def simulate_adaptive(catalogue, horizon):
+    delays = {kind: [] for kind in PROFILES}
+    scrapes = 0
+    queue = DueQueue()
+    state = {}
+    for index, product in enumerate(catalogue):
+        state[index] = {"volatility": None, "last": 0.0}
+        queue.push(0.0, index)
+
+    while queue.next_due() is not None and queue.next_due() <= horizon:
+        now = queue.next_due()
+        for index in queue.pop_due(now):
+            product, product_state = catalogue[index], state[index]
+            scrapes += 1
+            changed = changed_between(product, product_state["last"], now)
+            record_detections(product, product_state["last"], now, delays)
+            elapsed = now - product_state["last"] if product_state["last"] else CHECK_INTERVAL_MIN
+            product_state["volatility"] = update_volatility(product_state["volatility"], changed, elapsed)
+            product_state["last"] = now
+            queue.push(now + next_check_delay(product_state["volatility"], product["trackers"]), index)
+    return scrapes, delays
+
+
+def describe(label, scrapes, delays):
+    weighted = [(delay, trackers) for samples in delays.values() for delay, trackers in samples]
+    total_weight = sum(trackers for _, trackers in weighted) or 1
+    weighted_mean = sum(delay * trackers for delay, trackers in weighted) / total_weight
+    per_kind = ", ".join(
+        f"{kind} {statistics.mean(d for d, _ in samples) / 60:.0f}min" if samples else f"{kind} -"
+        for kind, samples in delays.items()
+    )
+    print(f"{label}: {scrapes} scrapes | tracker-weighted delay {weighted_mean / 60:.1f}min | mean delay {per_kind}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate fixed vs adaptive price check scheduling")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    horizon = args.days * 86400
+    catalogue = make_catalogue(args.products, horizon, random.Random(args.seed))
+    describe("fixed   ", *simulate_fixed(catalogue, horizon, CHECK_INTERVAL_MIN))
+    describe("adaptive", *simulate_adaptive(catalogue, horizon))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# benchmarks/bench_dispatcher.py
+#
+# Sends a broadcast through the shared MessageDispatcher using a fake Pyrogram client
+# that adds latency and occasionally answers with FloodWait. Run from the repository root:
+#
+#   python benchmarks/bench_dispatcher.py --users 500 --rate 25
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dispatcher import MessageDispatcher  # noqa: E402
+from fakes import FakeClient  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the outbound message dispatcher")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=25, help="global messages per second")
+    parser.add_argument("--latency", type=float, default=0.08, help="fake send_message latency in seconds")
+    parser.add_argument("--flood-rate", type=float, default=0.002)
+    parser.add_argument("--blocked-share", type=float, default=0.05)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    users = list(range(1, args.users + 1))
+    blocked = set(rng.sample(users, int(len(users) * args.blocked_share)))
+    client = FakeClient(args.latency, args.flood_rate, blocked, rng)
+    dispatcher = MessageDispatcher(client, rate=args.rate)
+
+    started = time.monotonic()
+    delivered, failed = await dispatcher.send_many(users, "Broadcast", tag="broadcast")
+    duration = time.monotonic() - started
+    await dispatcher.stop()
+
+    # Highest number of sends seen in any one-second window
+    times = [sent_at for _, _, sent_at in client.sent]
+    peak = max((sum(1 for t in times if start <= t < start + 1) for start in times), default=0)
+
+    old_estimate = args.users * (1 + args.latency)
+    print(f"dispatcher: {duration:.1f}s for {args.users} users, {delivered / duration:.1f} msg/s, peak {peak} msg/s")
+    print(f"            {dispatcher.stats.summary()}")
+    print(f"old loop (1s sleep per user): ~{old_estimate:.0f}s; 50k users ~{50000 * (1 + args.latency) / 3600:.1f}h "
+          f"vs ~{50000 / args.rate / 60:.0f}min")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+# benchmarks/bench_extract.py
+#
+# Parse time and peak memory per page for the full extractors (BeautifulSoup through
+# ExtractAmazon/ExtractFlipkart) against fast_extract, over the saved product pages in
+# benchmarks/fixtures. Also checks that both report the same price and availability.
+# Real product pages are larger than the fixtures; --pad-kb appends filler markup
+# to approach their size. Run from the repository root:
+#
+#   python benchmarks/bench_extract.py --runs 20 --pad-kb 500
+
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fast_extract  # noqa: E402
+from amazon import extract_product  # noqa: E402
+from scraper import extract_flipkart, parse_price  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FILLER = '<div class="related"><a href="/p/item"><img src="/i.jpg"/><span>Related product</span><span>₹1,499</span></a></div>\n'
+
+
+def full(platform, html):
+    """Price and availability as the scheduler sees them after the full extractor."""
+    if platform == "amazon":
+        price, _, available, _ = extract_product("fixture", html)
+    else:
+        _, price, available, _ = extract_flipkart("fixture", html)
+    return (parse_price(price) if available else 0), available
+
+
+def fast(platform, html):
+    result = fast_extract.extract(platform, html)
+    if result is None:
+        return None
+    price, available = result
+    return (parse_price(price) if available else 0), available
+
+
+def measure(func, platform, html, runs):
+    started = time.perf_counter()
+    for _ in range(runs):
+        result = func(platform, html)
+    duration = (time.perf_counter() - started) / runs
+    tracemalloc.start()
+    func(platform, html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, duration, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fast price extractor against the full parse")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--pad-kb", type=int, default=0, help="filler markup appended to every page")
+    args = parser.parse_args()
+
+    filler = FILLER * (args.pad_kb * 1024 // len(FILLER))
+    print(f"{'fixture':28} {'size':>8} {'full ms':>9} {'fast ms':>9} {'full peak':>10} {'fast peak':>10}  result")
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.html"))):
+        name = os.path.basename(path)
+        platform = name.split("_")[0]
+        with open(path, encoding="utf-8") as f:
+            html = f.read().replace("</body>", filler + "</body>")
+
+        full_result, full_time, full_peak = measure(full, platform, html, max(1, args.runs // 10))
+        fast_result, fast_time, fast_peak = measure(fast, platform, html, args.runs)
+        if fast_result is None:
+            verdict = "fallback"
+        elif fast_result == full_result:
+            verdict = "match"
+        else:
+            verdict = f"MISMATCH {fast_result} != {full_result}"
+        print(
+            f"{name:28} {len(html) / 1024:7.0f}K {full_time * 1000:9.2f} {fast_time * 1000:9.3f} "
+            f"{full_peak / 1048576:9.1f}M {fast_peak / 1048576:9.2f}M  {verdict}"
+        )
+
+
+if __name__ == "__main__":
+    main()
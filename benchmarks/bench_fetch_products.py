@@ -0,0 +1,84 @@
+# benchmarks/bench_fetch_products.py
+#
+# Round trips and latency of /my_trackings' product fetch by list size: the old
+# one-find_one-per-row loop against the $lookup aggregation. Uses the in-memory
+# collections from fakes.py with a fixed latency per round trip. Run from the
+# repository root:
+#
+#   python benchmarks/bench_fetch_products.py --sizes 10 100 500 --rtt 0.002
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name, value in (("DATABASE", "bench"), ("COLLECTION", "PriceTracker"), ("PRODUCTS", "PriceTrackerGlobal")):
+    os.environ.setdefault(name, value)
+
+import helpers  # noqa: E402
+from fakes import FakeDatabase  # noqa: E402
+
+
+async def legacy_fetch_all_products(user_id):
+    """The pre-aggregation implementation, kept here for comparison."""
+    cursor = helpers.collection.find({"user_id": user_id})
+    products = await cursor.to_list(length=None)
+    global_products = []
+    for product in products:
+        global_product = await helpers.PRODUCTS.find_one({"_id": product.get("product_id")})
+        if global_product:
+            global_product["product_id"] = product.get("_id")
+            global_products.append(global_product)
+    return global_products
+
+
+async def seed(database, user_id, size):
+    for i in range(size):
+        product = {
+            "product_name": f"Product {i}",
+            "url": f"https://www.amazon.in/dp/B{i:09d}",
+            "affiliate_url": f"https://aff.example/{i}",
+            "price": 100 + i,
+            "previous_price": 100 + i,
+            "upper": 100 + i,
+            "lower": 100 + i,
+        }
+        result = await database["PriceTrackerGlobal"].insert_one(product)
+        await database["PriceTracker"].insert_one({"user_id": user_id, "product_id": result.inserted_id})
+
+
+async def measure(database, fetch, *args, **kwargs):
+    database.reset_round_trips()
+    started = time.perf_counter()
+    products = await fetch(*args, **kwargs)
+    return len(products), database.round_trips, (time.perf_counter() - started) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark fetching a user's tracked products")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--rtt", type=float, default=0.002, help="seconds added to every Mongo round trip")
+    args = parser.parse_args()
+
+    print(f"{'size':>6} | {'legacy trips':>12} {'legacy ms':>10} | {'lookup trips':>12} {'lookup ms':>10} | {'page trips':>10} {'page ms':>8}")
+    for size in args.sizes:
+        database = FakeDatabase(latency=args.rtt)
+        helpers.collection = database["PriceTracker"]
+        helpers.PRODUCTS = database["PriceTrackerGlobal"]
+        await seed(database, 1, size)
+
+        _, legacy_trips, legacy_ms = await measure(database, legacy_fetch_all_products, 1)
+        _, lookup_trips, lookup_ms = await measure(database, helpers.fetch_all_products, 1)
+        _, page_trips, page_ms = await measure(
+            database, helpers.fetch_all_products, 1, skip=0, limit=helpers.TRACKINGS_PAGE_SIZE
+        )
+        print(
+            f"{size:>6} | {legacy_trips:>12} {legacy_ms:>10.1f} | {lookup_trips:>12} {lookup_ms:>10.1f} | "
+            f"{page_trips:>10} {page_ms:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+# benchmarks/bench_handler_latency.py
+#
+# Measures how long a bot handler waits for the event loop while a sweep is running,
+# once with the blocking extractors called inline (old behaviour) and once with them
+# moved onto the scrape pool. Run from the repository root:
+#
+#   python benchmarks/bench_handler_latency.py --products 80 --latency 0.05
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import executor  # noqa: E402
+from sweep import HostRateLimiter, run_sweep  # noqa: E402
+from bench_sweep import make_products  # noqa: E402
+
+
+def blocking_extract(url, latency):
+    """Stand-in for ExtractAmazon/ExtractFlipkart: network wait plus parsing, all blocking."""
+    time.sleep(latency)
+    return "Fake product", "100", True, None
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def handler_probe(stop, interval, samples):
+    """Simulates a user command arriving every `interval` seconds and records its delay."""
+    while not stop.is_set():
+        expected = time.monotonic() + interval
+        await asyncio.sleep(interval)
+        samples.append((time.monotonic() - expected) * 1000)
+
+
+async def run(products, latency, offload, workers):
+    async def check_product(product, platform):
+        if offload:
+            await executor.run_blocking(blocking_extract, product["url"], latency)
+        else:
+            blocking_extract(product["url"], latency)
+
+    samples = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(handler_probe(stop, 0.01, samples))
+    report = await run_sweep(
+        products,
+        check_product,
+        workers={"amazon": workers, "flipkart": workers},
+        rate_limiter=HostRateLimiter(0),
+    )
+    stop.set()
+    await probe
+    return report, samples
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark handler latency during a sweep")
+    parser.add_argument("--products", type=int, default=80)
+    parser.add_argument("--latency", type=float, default=0.05, help="blocking extractor time in seconds")
+    parser.add_argument("--workers", type=int, default=4, help="workers per platform")
+    args = parser.parse_args()
+
+    products = make_products(args.products)
+    for offload in (False, True):
+        report, samples = await run(products, args.latency, offload, args.workers)
+        label = "scrape pool" if offload else "inline     "
+        print(
+            f"{label}: sweep {report.duration:.2f}s | handler delay "
+            f"p50 {statistics.median(samples):.1f}ms, p99 {percentile(samples, 99):.1f}ms, "
+            f"max {max(samples):.1f}ms ({len(samples)} samples)"
+        )
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,182 @@
+# benchmarks/bench_leases.py
+#
+# Runs several workers sweeping one products collection at once to check that leases
+# keep them from scraping or announcing a product twice. Every product changes price,
+# so each must be announced exactly once; a share of scrapes stall past the lease so
+# other workers take those products over. Workers record their scrapes and
+# announcements in the database, and the counts are read back at the end.
+#
+# By default the workers are concurrent sweeps in one process against mongomock-motor
+# (`pip install mongomock-motor`), so queries and find_one_and_update follow Mongo's
+# own semantics. With --mongo-uri each worker is a separate process running against
+# a real mongod, e.g. one started with `docker run --rm -p 27017:27017 mongo`; the
+# run uses a fresh database that is dropped afterwards. Run from the repository root:
+#
+#   python benchmarks/bench_leases.py --products 500 --workers 4 --stall-rate 0.02
+#   python benchmarks/bench_leases.py --products 500 --workers 4 --mongo-uri mongodb://localhost:27017
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name, value in (("DATABASE", "bench"), ("COLLECTION", "PriceTracker"), ("PRODUCTS", "PriceTrackerGlobal"),
+                    ("SWEEP_HOST_RATE_LIMIT", "0")):
+    os.environ.setdefault(name, value)
+
+import db  # noqa: E402
+import events  # noqa: E402
+import leases  # noqa: E402
+import scheduler  # noqa: E402
+from bench_sweep import make_products  # noqa: E402
+
+SCRAPES = db.collection("BenchScrapes")  # {_id: url, count}
+ANNOUNCED = db.collection("BenchAnnounced")  # {_id: product id, count}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check lease-based sweeps across several workers")
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4, help="concurrent sweeps (processes with --mongo-uri)")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean fake scrape latency in seconds")
+    parser.add_argument("--stall-rate", type=float, default=0.02, help="share of scrapes that outlive their lease")
+    parser.add_argument("--lease", type=float, default=1.0, help="lease length in seconds")
+    parser.add_argument("--mongo-uri", help="run each worker as a process against this mongod")
+    parser.add_argument("--timeout", type=float, default=300, help="give up after this many seconds")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)  # Set on the spawned worker processes
+    return parser.parse_args()
+
+
+def install_fakes(args, seed):
+    """Fake scrapes (every price drops to 90) and announcement counting for the sweeps of this process."""
+    rng = random.Random(seed)
+    leases.LEASE_SECONDS = args.lease
+    scheduler.PRICE_UPDATE_FLUSH_INTERVAL = args.lease / 5  # Writes must land well within the lease
+
+    async def scrape(url, platform, state=None):
+        await SCRAPES.update_one({"_id": url}, {"$inc": {"count": 1}}, upsert=True)
+        stalled = rng.random() < args.stall_rate
+        await asyncio.sleep(args.lease * 2 if stalled else args.latency * rng.uniform(0.5, 1.5))
+        return ("Fake product", 90, True, None), state
+
+    async def count_announcements(changed):
+        for product_id in changed:
+            await ANNOUNCED.update_one({"_id": product_id}, {"$inc": {"count": 1}}, upsert=True)
+
+    scheduler.scrape_if_changed = scrape
+    events.subscribe(events.PRICE_CHANGED, count_announcements)
+
+
+async def sweep_until_done(args):
+    """One worker: sweep every lease period until all products carry the new price."""
+    # Keep sweeping until stalled products have been taken over and written
+    while await scheduler.PRODUCTS.count_documents({"price": {"$ne": 90}}):
+        await scheduler.check_prices()
+        await asyncio.sleep(args.lease)
+    await events.drain()
+
+
+async def run_worker(args):
+    """Body of a spawned worker process; MONGO_URI and DATABASE come from the environment."""
+    install_fakes(args, 7 + args.worker)
+    try:
+        await sweep_until_done(args)
+    finally:
+        db.close()
+
+
+async def spawn_workers(args, database):
+    env = {**os.environ, "MONGO_URI": args.mongo_uri, "DATABASE": database}
+    options = ["--latency", str(args.latency), "--stall-rate", str(args.stall_rate), "--lease", str(args.lease)]
+    processes = [
+        await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "--worker", str(index), *options,
+            env={**env, "WORKER_ID": f"bench-worker-{index}"},
+        )
+        for index in range(args.workers)
+    ]
+    try:
+        codes = await asyncio.wait_for(asyncio.gather(*(process.wait() for process in processes)), args.timeout)
+    except asyncio.TimeoutError:
+        codes = None
+    finally:
+        for process in processes:
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+    if codes is None:
+        sys.exit(f"workers did not finish within {args.timeout}s")
+    if any(codes):
+        sys.exit(f"workers exited with {codes}")
+
+
+def mongomock_database():
+    try:
+        from mongomock.collection import BulkOperationBuilder
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit("bench_leases needs mongomock-motor (pip install mongomock-motor) or --mongo-uri")
+
+    # pymongo 4.9+ passes `sort` to every bulk update and replace, which mongomock 4.3 does
+    # not accept yet; the sweep never sorts its bulk writes, so the argument is always None
+    for name in ("add_update", "add_replace"):
+        method = getattr(BulkOperationBuilder, name)
+
+        def without_sort(self, *args, method=method, sort=None, **kwargs):
+            if sort is not None:
+                raise NotImplementedError("sorted bulk writes")
+            return method(self, *args, **kwargs)
+        setattr(BulkOperationBuilder, name, without_sort)
+    return AsyncMongoMockClient()["bench"]
+
+
+async def main():
+    args = parse_args()
+    if args.worker is not None:
+        return await run_worker(args)
+
+    if args.mongo_uri:
+        database = f"bench_leases_{os.getpid()}"
+        db.MONGO_URI, db.DATABASE = args.mongo_uri, database
+        await db.connect()  # Fail fast if the server is unreachable
+    else:
+        db.use_database(mongomock_database())
+
+    try:
+        await scheduler.PRODUCTS.create_index("next_check_at")
+        await scheduler.PRODUCTS.insert_many(
+            [{**product, "upper": 100, "lower": 100} for product in make_products(args.products)]
+        )
+
+        started = time.monotonic()
+        if args.mongo_uri:
+            await spawn_workers(args, database)
+        else:
+            install_fakes(args, 7)
+            sweeps = asyncio.gather(*(sweep_until_done(args) for _ in range(args.workers)))
+            try:
+                await asyncio.wait_for(sweeps, args.timeout)
+            except asyncio.TimeoutError:
+                sys.exit(f"sweeps did not finish within {args.timeout}s")
+        duration = time.monotonic() - started
+
+        scrapes = [document["count"] async for document in SCRAPES.find({}, {"count": 1})]
+        announced = [document["count"] async for document in ANNOUNCED.find({}, {"count": 1})]
+    finally:
+        if args.mongo_uri:
+            await db.get_client().drop_database(database)
+        db.close()
+
+    mode = "processes on " + args.mongo_uri if args.mongo_uri else "sweeps on mongomock-motor"
+    rescraped = sum(1 for count in scrapes if count > 1)
+    duplicates = sum(1 for count in announced if count > 1)
+    print(f"{args.workers} {mode}, {args.products} products in {duration:.1f}s")
+    print(f"scrapes: {sum(scrapes)} ({rescraped} products scraped again after their lease expired)")
+    print(f"announced: {len(announced)} of {args.products} products, {duplicates} announced more than once")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
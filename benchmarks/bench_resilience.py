@@ -0,0 +1,81 @@
+# benchmarks/bench_resilience.py
+#
+# Time a sweep spends on a platform that is down: the old fixed retry (3 attempts,
+# exponential waits of 2-10s, every error retried) against resilience.call's circuit
+# breaker and retry budget. The fake scraper fails every call with a connection error.
+# Run from the repository root:
+#
+#   python benchmarks/bench_resilience.py --products 200 --latency 0.2
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+from tenacity import retry, stop_after_attempt, wait_exponential  # noqa: E402
+import resilience  # noqa: E402
+from bench_sweep import make_products  # noqa: E402
+from sweep import HostRateLimiter, run_sweep  # noqa: E402
+
+
+def failing_scraper(latency, calls):
+    async def scrape(url):
+        calls.append(url)
+        await asyncio.sleep(latency)
+        raise requests.ConnectionError("connection refused")
+    return scrape
+
+
+async def sweep(products, check_product, workers, platform_available=None):
+    return await run_sweep(
+        products,
+        check_product,
+        workers={"amazon": workers, "flipkart": workers},
+        rate_limiter=HostRateLimiter(0),
+        platform_available=platform_available,
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark a sweep against a platform outage")
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before each fake request fails")
+    parser.add_argument("--workers", type=int, default=4, help="workers per platform")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    products = make_products(args.products)
+
+    if not args.skip_legacy:
+        calls = []
+        scrape = retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))(
+            failing_scraper(args.latency, calls)
+        )
+        started = time.monotonic()
+        await sweep(products, lambda product, platform: scrape(product["url"]), args.workers)
+        print(f"fixed retries: {time.monotonic() - started:.1f}s, {len(calls)} requests")
+
+    calls = []
+    scrape = failing_scraper(args.latency, calls)
+    skipped = 0
+
+    async def check_product(product, platform):
+        nonlocal skipped
+        try:
+            await resilience.call(platform, scrape, product["url"])
+        except resilience.CircuitOpenError:
+            skipped += 1
+
+    resilience.start_sweep()
+    started = time.monotonic()
+    await sweep(products, check_product, args.workers, lambda platform: not resilience.get_breaker(platform).is_open())
+    print(f"circuit breaker: {time.monotonic() - started:.1f}s, {len(calls)} requests, {skipped} skipped")
+    print(resilience.summary())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,345 @@
+# benchmarks/bench_scenarios.py
+#
+# End-to-end scenarios against the in-memory fakes: price sweeps through check_prices
+# with alert fan-out to every subscriber and periodic digests, /my_trackings pages
+# through fetch_all_products and link submissions through track_product_url. Products
+# come due in staggered groups, so the catalogue is checked by several small sweeps
+# like in production. Prices come
+# from a deterministic FakeCatalogue behind fake ExtractAmazon/ExtractFlipkart
+# classes, messages go to a FakeClient. Results can be written as JSON and compared
+# with an earlier run, failing when sweep time or alert latency regressed:
+#
+#   python benchmarks/bench_scenarios.py --products 10000 --users 100000 --change-rate 0.05 --json results.json
+#   python benchmarks/bench_scenarios.py --baseline results.json --tolerance 0.25
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name, value in (("DATABASE", "bench"), ("COLLECTION", "PriceTracker"), ("PRODUCTS", "PriceTrackerGlobal"),
+                    ("SWEEP_HOST_RATE_LIMIT", "0"), ("CONDITIONAL_FETCH", "false")):
+    os.environ.setdefault(name, value)
+
+import alerts  # noqa: E402
+import amazon  # noqa: E402
+import db  # noqa: E402
+import dispatcher  # noqa: E402
+import events  # noqa: E402
+import helpers  # noqa: E402
+import history  # noqa: E402
+import main as bot  # noqa: E402
+import scheduler  # noqa: E402
+import scraper  # noqa: E402
+from bench_sweep import make_products, product_url  # noqa: E402
+from urlnorm import product_key  # noqa: E402
+from fakes import FakeCatalogue, FakeClient, FakeDatabase  # noqa: E402
+
+# Results where a higher value is a regression, checked by --baseline
+REGRESSION_KEYS = (
+    "sweep.seconds",
+    "sweep.mongo_round_trips",
+    "alerts.latency_p50",
+    "alerts.latency_p95",
+    "my_trackings.p95_ms",
+    "track_link.p95_ms",
+)
+LINK_PATTERN = re.compile(r"\((https?://[^)\s]+)\)")
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def use_database(database):
+    """Resolve every collection handle (db.py) against the fake database."""
+    db.use_database(database)
+    helpers.collection.index_on("user_id", "product_id")
+    helpers.USERS.index_on("user_id")
+    helpers.PRODUCTS.index_on("product_key")
+    helpers.DIGESTS.index_on("claim")
+    history.PRICE_HISTORY.index_on("product_id")
+
+
+async def seed(database, catalogue, args, rng):
+    """Users (a share on digest mode), their trackings and products due in `--sweeps` staggered groups.
+
+    Products are inserted last, so their due times count from the end of seeding: the first
+    group is already due, each later one `--sweep-gap` seconds after the one before.
+    """
+    users = [
+        {"user_id": user_id, **({"alert_mode": "digest"} if rng.random() < args.digest_share else {})}
+        for user_id in range(1, args.users + 1)
+    ]
+    await helpers.USERS.insert_many(users)
+
+    trackings = []
+    for user_id in range(1, args.users + 1):
+        for product_id in rng.sample(range(args.products), min(args.products, args.trackings_per_user)):
+            trackings.append({"user_id": user_id, "product_id": product_id})
+    await helpers.collection.insert_many(trackings)
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    products = []
+    for product in make_products(args.products):
+        price = catalogue.prices[product["url"]]
+        platform, key = product_key(product["url"])
+        due = rng.randrange(args.sweeps) * args.sweep_gap - rng.uniform(0, args.sweep_gap)
+        products.append({
+            **product,
+            "platform": platform,
+            "product_key": key,
+            "product_name": f"Fake product {product['_id']}",
+            "affiliate_url": product["url"] + "?affid=bench",
+            "price": price, "previous_price": price, "upper": price, "lower": price,
+            "next_check_at": now + datetime.timedelta(seconds=due),
+        })
+    await helpers.PRODUCTS.insert_many(products)
+    database.reset_round_trips()
+    return len(trackings), time.monotonic()
+
+
+async def sweep_scenario(database, catalogue, client, args, seeded_at):
+    """A sweep for each staggered group of due products after a share of prices moved, every
+    alert they send and a digest flush every `--digest-every` sweeps (once at the end by default)."""
+    changed = catalogue.next_round()
+
+    async def send_price_alerts(changed_products):
+        await alerts.notify_users(changed_products, client)
+
+    events.subscribe(events.PRICE_CHANGED, send_price_alerts)
+    outbox = dispatcher.get_dispatcher(client)
+    outbox.limiter = dispatcher.RateLimiter(args.telegram_rate)
+    database.reset_round_trips()
+    digest_every = args.digest_every or args.sweeps
+    duration = 0.0
+    digests = []  # Chats of the digest messages sent by each flush
+    for index in range(args.sweeps):
+        await asyncio.sleep(max(0.0, seeded_at + index * args.sweep_gap - time.monotonic()))
+        started = time.monotonic()
+        await scheduler.check_prices()
+        duration += time.monotonic() - started
+        if (index + 1) % digest_every == 0 or index + 1 == args.sweeps:
+            await events.drain()  # Every change of these sweeps is queued before the flush
+            already_sent = len(client.sent)
+            await alerts.send_digests(client)
+            digests.append([chat_id for chat_id, text, _ in client.sent[already_sent:] if text.startswith("🛒")])
+    round_trips = database.round_trips
+    events.unsubscribe(events.PRICE_CHANGED, send_price_alerts)
+
+    # Alert latency: from the page download that saw a new price to the instant alert carrying it
+    # (digests wait for their flush by design)
+    latencies = []
+    for _, text, sent_at in client.sent:
+        if text.startswith("🛒"):
+            continue
+        for link in LINK_PATTERN.findall(text):
+            url = link.split("?")[0]
+            if url in catalogue.scraped_at:
+                latencies.append(sent_at - catalogue.scraped_at[url])
+
+    # A digest user must get one summary per flush, however many sweeps and batches its prices came in
+    repeated_digests = sum(len(chats) - len(set(chats)) for chats in digests)
+
+    moved = sum(1 for product in helpers.PRODUCTS.documents.values() if product["price"] != product["previous_price"])
+    return {
+        "sweep": {
+            "seconds": round(duration, 3),
+            "sweeps": args.sweeps,
+            "products": args.products,
+            "products_per_sec": round(args.products / duration, 1),
+            "scrapes": catalogue.scrapes,
+            "changed": len(changed),
+            "price_changes_written": moved,
+            "mongo_round_trips": round_trips,
+        },
+        "alerts": {
+            "messages": len(client.sent),
+            "delivered": sum(outbox.stats.sent.values()),
+            "failed": sum(outbox.stats.failed.values()),
+            "latency_p50": round(percentile(latencies, 50), 3),
+            "latency_p95": round(percentile(latencies, 95), 3),
+            "latency_max": round(max(latencies, default=0.0), 3),
+            "digest_flushes": len(digests),
+            "digests": sum(len(chats) for chats in digests),
+            "repeated_digests": repeated_digests,
+        },
+    }
+
+
+async def my_trackings_scenario(database, args, rng):
+    """First /my_trackings page and the tracked product count for a sample of users."""
+    samples = []
+    database.reset_round_trips()
+    users = rng.sample(range(1, args.users + 1), min(args.users, args.sample_users))
+    for user_id in users:
+        started = time.perf_counter()
+        await helpers.count_tracked_products(user_id)
+        await helpers.fetch_all_products(user_id, limit=helpers.TRACKINGS_PAGE_SIZE)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "my_trackings": {
+            "calls": len(samples),
+            "p50_ms": round(percentile(samples, 50), 3),
+            "p95_ms": round(percentile(samples, 95), 3),
+            "round_trips_per_call": round(database.round_trips / max(1, len(samples)), 2),
+        }
+    }
+
+
+class FakeStatus:
+    """The "Analyzing..." message track_product_url edits with its answer."""
+
+    def __init__(self):
+        self.answered_at = None
+
+    async def reply_text(self, *args, **kwargs):
+        return self
+
+    async def reply_photo(self, *args, **kwargs):
+        return self
+
+    async def edit_text(self, *args, **kwargs):
+        self.answered_at = time.perf_counter()
+
+    edit = edit_text
+
+
+class FakeMessage:
+    def __init__(self, user_id, text):
+        self.text = text
+        self.photo = None
+        self.document = None
+        self.chat = self.from_user = type("Peer", (), {"id": user_id})()
+        self.status = FakeStatus()
+
+    async def reply_text(self, *args, **kwargs):
+        return self.status
+
+    async def delete(self):
+        pass
+
+
+async def track_link_scenario(args, rng):
+    """Link submissions, about half for products someone already tracks (served from the caches)."""
+    async def convert_to_affiliate_link(url):
+        return url + "?affid=bench"
+
+    bot.convert_to_affiliate_link = convert_to_affiliate_link
+    samples = []
+    for index in range(args.sample_links):
+        product_id = rng.randrange(args.products) if index % 2 else args.products + index
+        url = product_url(product_id)
+        message = FakeMessage(rng.randrange(1, args.users + 1), url)
+        started = time.perf_counter()
+        await bot.track_product_url(None, message)
+        samples.append((message.status.answered_at - started) * 1000)
+    return {
+        "track_link": {
+            "calls": len(samples),
+            "p50_ms": round(percentile(samples, 50), 3),
+            "p95_ms": round(percentile(samples, 95), 3),
+        }
+    }
+
+
+def flatten(results):
+    return {f"{group}.{key}": value for group, values in results.items() for key, value in values.items()}
+
+
+def compare(results, baseline, tolerance):
+    """Regressed keys as (key, baseline, current); higher is worse for every REGRESSION_KEYS entry."""
+    current, previous = flatten(results), flatten(baseline["results"])
+    return [
+        (key, previous[key], current[key])
+        for key in REGRESSION_KEYS
+        if key in current and previous.get(key) and current[key] > previous[key] * (1 + tolerance)
+    ]
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    database = FakeDatabase(latency=args.rtt)
+    use_database(database)
+
+    urls = [product["url"] for product in make_products(args.products)]
+    catalogue = FakeCatalogue(urls, change_rate=args.change_rate, latency=args.scrape_latency, seed=args.seed)
+    extractor = catalogue.extractor()
+    amazon.ExtractAmazon = scraper.ExtractFlipkart = extractor
+
+    started = time.monotonic()
+    trackings, seeded_at = await seed(database, catalogue, args, rng)
+    print(f"seeded {args.products} products, {args.users} users, {trackings} trackings "
+          f"in {time.monotonic() - started:.1f}s")
+
+    client = FakeClient(latency=args.send_latency)
+    results = {}
+    results.update(await sweep_scenario(database, catalogue, client, args, seeded_at))
+    await dispatcher.stop_dispatchers()
+    results.update(await my_trackings_scenario(database, args, rng))
+    results.update(await track_link_scenario(args, rng))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scenario benchmarks against in-memory fakes")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--trackings-per-user", type=int, default=3)
+    parser.add_argument("--change-rate", type=float, default=0.05, help="share of products whose price moves")
+    parser.add_argument("--digest-share", type=float, default=0.1, help="share of users on /digest mode")
+    parser.add_argument("--sweeps", type=int, default=4, help="staggered groups of due products, one sweep each")
+    parser.add_argument("--sweep-gap", type=float, default=1.0, help="seconds between two groups coming due")
+    parser.add_argument("--digest-every", type=int, default=0, help="sweeps per digest flush, 0 for one at the end")
+    parser.add_argument("--scrape-latency", type=float, default=0.01, help="mean fake page download in seconds")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="fake send_message latency in seconds")
+    parser.add_argument("--telegram-rate", type=float, default=0, help="global messages per second, 0 for no limit")
+    parser.add_argument("--rtt", type=float, default=0.0, help="fake Mongo round trip in seconds")
+    parser.add_argument("--sample-users", type=int, default=500, help="users whose /my_trackings page is timed")
+    parser.add_argument("--sample-links", type=int, default=200, help="links submitted through track_product_url")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)  # main.py configures INFO on import
+    results = asyncio.run(run(args))
+    for key, value in flatten(results).items():
+        print(f"{key:32} {value}")
+
+    report = {
+        "scenario": {key: value for key, value in vars(args).items() if key not in ("json", "baseline", "tolerance")},
+        "results": results,
+        "python": platform.python_version(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["scenario"] != report["scenario"]:
+            print("warning: the baseline was recorded with different scenario parameters")
+        regressions = compare(results, baseline, args.tolerance)
+        for key, previous, current in regressions:
+            print(f"REGRESSION {key}: {previous} -> {current} (+{(current / previous - 1) * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_sweep.py
+#
+# Compares the old sequential price check loop against the concurrent sweep engine
+# using a fake scraper that only sleeps. Run from the repository root:
+#
+#   python benchmarks/bench_sweep.py --products 200 --latency 0.3
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sweep import HostRateLimiter, run_sweep  # noqa: E402
+
+
+def product_url(i):
+    if i % 2:
+        return f"https://www.amazon.in/dp/B0{i:08d}"
+    return f"https://www.flipkart.com/item/p/itm{i:010d}"
+
+
+def make_products(count):
+    return [{"_id": i, "url": product_url(i), "price": 100} for i in range(count)]
+
+
+def fake_scraper(latency, failure_rate, rng):
+    async def scrape(url, platform):
+        await asyncio.sleep(latency * rng.uniform(0.5, 1.5))
+        if rng.random() < failure_rate:
+            raise RuntimeError("fake scrape failure")
+        return "Fake product", 100, True, None
+    return scrape
+
+
+async def sequential(products, scrape, sleep):
+    """The pre-engine loop: one product at a time followed by a flat sleep."""
+    started = time.monotonic()
+    failures = 0
+    for product in products:
+        platform = "amazon" if "amazon" in product["url"] else "flipkart"
+        try:
+            await scrape(product["url"], platform)
+        except Exception:
+            failures += 1
+        await asyncio.sleep(sleep)
+    duration = time.monotonic() - started
+    return duration, len(products) / duration, failures
+
+
+async def concurrent(products, scrape, workers, rate):
+    async def check_product(product, platform):
+        await scrape(product["url"], platform)
+
+    report = await run_sweep(
+        products,
+        check_product,
+        workers={"amazon": workers, "flipkart": workers},
+        rate_limiter=HostRateLimiter(rate),
+    )
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the concurrent price check sweep")
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.3, help="mean fake scrape latency in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--workers", type=int, default=4, help="workers per platform")
+    parser.add_argument("--rate", type=float, default=10, help="requests per second per host")
+    parser.add_argument("--sleep", type=float, default=1.0, help="flat sleep used by the sequential loop")
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    products = make_products(args.products)
+
+    if not args.skip_sequential:
+        scrape = fake_scraper(args.latency, args.failure_rate, random.Random(42))
+        duration, rate, failures = await sequential(products, scrape, args.sleep)
+        print(f"sequential: {duration:.1f}s, {rate:.2f} products/sec, {failures} failures")
+
+    scrape = fake_scraper(args.latency, args.failure_rate, random.Random(42))
+    report = await concurrent(products, scrape, args.workers, args.rate)
+    print(f"concurrent: {report.summary()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+# benchmarks/bench_url_matcher.py
+#
+# Times message filtering and platform detection over a corpus of product and junk
+# messages: the old joined regex lists against the host table in regex_patterns.
+# Run from the repository root:
+#
+#   python benchmarks/bench_url_matcher.py --messages 50000
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from regex_patterns import find_product_urls  # noqa: E402
+
+# The pattern lists as they were before the host table
+OLD_FLIPKART = [
+    r'https?://www\.flipkart\.com/.+', r'https?://flipkart\.com/.+', r'https?://m\.flipkart\.com/.+',
+    r'https?://dl\.flipkart\.com/.+', r'https?://flipkart\.in/.+', r'https?://www\.flipkart\.in/.+',
+    r'https?://dl\.flipkart\.in/.+', r'https?://m\.flipkart\.in/.+', r'https?://fkrt\.cc/.+',
+    r'https?://fkrt\.co/.+', r'https?://fkrt\.it/.+', r'https?://fktr\.it/.+',
+]
+OLD_AMAZON = [
+    r'https://www\.amazon\.com/.*', r'https://amazon\.com/.*', r'https://www\.amazon\.in/.*',
+    r'https://amazon\.in/.*', r'https://amzn\.in/.*', r'https://amzn\.to/.*', r'https://amzn\.in/.+',
+]
+OLD_FILTER = re.compile("|".join(OLD_AMAZON + OLD_FLIPKART))
+
+PRODUCT_LINKS = [
+    "https://www.amazon.in/Samsung-Galaxy-Storage-Additional-Exchange/dp/B0CS5XW6TN/ref=sr_1_1?crid=2&keywords=s23",
+    "https://amzn.to/3xYzAbC",
+    "https://amzn.in/d/0aBcDeF",
+    "https://www.flipkart.com/apple-iphone-15-black-128-gb/p/itm6ac6485515ae4?pid=MOBGTAGPTB3VS24W&lid=LSTMOB",
+    "https://dl.flipkart.com/s/abcdEFuuNN",
+    "https://fkrt.it/Xyz12NNNN",
+]
+JUNK = [
+    "hey what's the best phone under 20k?",
+    "check this out https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://example.com/amazon.in/dp/B0CS5XW6TN fake link",
+    "lol " * 40,
+    "/start",
+    "Deal alert!!! go to amazon dot in and search for headphones",
+]
+
+
+def make_corpus(count, product_share, rng):
+    corpus = []
+    for _ in range(count):
+        if rng.random() < product_share:
+            corpus.append(f"{rng.choice(['Look', 'Track this', ''])} {rng.choice(PRODUCT_LINKS)} {rng.choice(['pls', '', 'thanks!'])}")
+        else:
+            corpus.append(rng.choice(JUNK))
+    return corpus
+
+
+def old_pipeline(text):
+    # filters.regex over the joined alternation, then extract_urls + per-URL re.match
+    if not list(OLD_FILTER.finditer(text)):
+        return []
+    results = []
+    for url in re.findall(r'https?://\S+', text):
+        platform = "amazon" if any(re.match(pattern, url) for pattern in OLD_AMAZON) else "flipkart"
+        results.append((url, platform))
+    return results
+
+
+def new_pipeline(text):
+    return [(link.url, link.platform) for link in find_product_urls(text)]
+
+
+def timed(pipeline, corpus):
+    started = time.perf_counter()
+    found = sum(len(pipeline(text)) for text in corpus)
+    return time.perf_counter() - started, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark product link matching")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--product-share", type=float, default=0.3)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.messages, args.product_share, random.Random(11))
+    for label, pipeline in (("regex lists", old_pipeline), ("host table ", new_pipeline)):
+        duration, found = timed(pipeline, corpus)
+        print(f"{label}: {duration * 1000:.0f}ms, {duration / len(corpus) * 1e6:.2f}us/message, {found} links")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,530 @@
+# benchmarks/fakes.py
+#
+# Small in-memory stand-ins used by the benchmarks. FakeCollection implements the
+# subset of the Motor collection API this bot uses, counts round trips and can
+# add a fixed latency to each one to mimic the network hop to Mongo. FakeCatalogue
+# and FakeClient stand in for the product pages and for Telegram.
+#
+# Why not mongomock-motor: it evaluates every query by scanning the whole
+# collection and ignores indexes, so at the 100k-product scale of the scenario
+# benchmarks a single lookup by product_id costs ~200 ms against ~3 ms here, and
+# seeding takes several times longer; the timings would measure mongomock rather
+# than the bot. Correctness checks that need Mongo's own semantics use
+# mongomock-motor or a real mongod instead (bench_leases.py). To stay honest the
+# fake raises NotImplementedError for any operator it does not implement rather
+# than ignoring it.
+
+import asyncio
+import copy
+import itertools
+import random
+import time
+
+
+_ids = itertools.count(1)
+
+
+def _get(document, path):
+    if "." not in path:
+        return document.get(path)
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _comparable(value, operand):
+    """Mongo only orders values of the same type (all numbers count as one); anything else never matches."""
+    if value is None or isinstance(value, bool) or isinstance(operand, bool):
+        return False
+    if isinstance(value, (int, float)) and isinstance(operand, (int, float)):
+        return True
+    return type(value) is type(operand)
+
+
+_OPERATORS = {
+    "$gt": lambda value, operand: _comparable(value, operand) and value > operand,
+    "$gte": lambda value, operand: _comparable(value, operand) and value >= operand,
+    "$lt": lambda value, operand: _comparable(value, operand) and value < operand,
+    "$lte": lambda value, operand: _comparable(value, operand) and value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+    "$ne": lambda value, operand: value != operand,
+}
+
+
+def _has(document, path):
+    """True when `path` is set on the document, even to None ($exists)."""
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.get(part) if isinstance(document, dict) else None
+    return isinstance(document, dict) and last in document
+
+
+def _compile(query):
+    """A predicate for `query`, built once so scans do not re-read the query per document."""
+    tests = []
+    for key, condition in query.items():
+        if key == "$or":
+            branches = [_compile(sub) for sub in condition]
+            tests.append(lambda document, branches=branches: any(branch(document) for branch in branches))
+        elif key == "$and":
+            branches = [_compile(sub) for sub in condition]
+            tests.append(lambda document, branches=branches: all(branch(document) for branch in branches))
+        elif key.startswith("$"):
+            raise NotImplementedError(f"query operator {key}")
+        elif type(condition) is dict and condition and next(iter(condition))[0] == "$":
+            for op, operand in condition.items():
+                if op == "$exists":
+                    tests.append(lambda document, key=key, operand=operand: _has(document, key) == bool(operand))
+                elif op in _OPERATORS:
+                    tests.append(lambda document, key=key, test=_OPERATORS[op], operand=operand:
+                                 test(_get(document, key), operand))
+                else:
+                    raise NotImplementedError(f"query operator {op} (on {key})")
+        else:
+            tests.append(lambda document, key=key, condition=condition: _get(document, key) == condition)
+
+    def matches(document):
+        for test in tests:
+            if not test(document):
+                return False
+        return True
+    return matches
+
+
+def _matches(document, query):
+    return _compile(query)(document)
+
+
+def _project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    include_id = projection.get("_id", 1)
+    fields = [key for key, flag in projection.items() if key != "_id" and flag]
+    if fields:
+        result = {key: copy.deepcopy(document[key]) for key in fields if key in document}
+    else:
+        result = {key: copy.deepcopy(value) for key, value in document.items() if projection.get(key, 1)}
+    if include_id and "_id" in document:
+        result["_id"] = document["_id"]
+    elif not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def _apply_update(document, update):
+    for op, fields in update.items():
+        for key, value in fields.items():
+            current = document.get(key)
+            if op == "$set":
+                document[key] = value
+            elif op == "$setOnInsert":
+                continue
+            elif op == "$unset":
+                document.pop(key, None)
+            elif op == "$inc":
+                document[key] = (current or 0) + value
+            elif op == "$max":
+                document[key] = value if current is None or value > current else current
+            elif op == "$min":
+                document[key] = value if current is None or value < current else current
+            elif op == "$push":
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                document.setdefault(key, []).extend(items)
+                if isinstance(value, dict) and "$slice" in value:
+                    document[key] = document[key][value["$slice"]:]
+            else:
+                raise NotImplementedError(op)
+
+
+class FakeResult:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeCursor:
+    def __init__(self, collection, documents, projection=None):
+        self._collection = collection
+        self._documents = documents
+        self._projection = projection
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=1):
+        if isinstance(key, list):
+            key, direction = key[0]
+        self._documents.sort(key=lambda d: (_get(d, key) is None, _get(d, key)), reverse=direction < 0)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def _window(self):
+        documents = self._documents[self._skip:]
+        documents = documents[:self._limit] if self._limit else documents
+        return [_project(d, self._projection) for d in documents] if self._projection else documents
+
+    async def to_list(self, length=None):
+        await self._collection._round_trip()
+        documents = self._window()
+        return documents[:length] if length else documents
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self._collection._round_trip()
+        for document in self._window():
+            yield document
+
+
+class FakeCollection:
+    def __init__(self, name, database=None, latency=0.0):
+        self.name = name
+        self.database = database
+        self.latency = latency
+        self.documents = {}
+        self.round_trips = 0
+        self.indexes = []
+        self._hashed = {}  # field -> {value: set of _ids}, see index_on
+        self._sorted = {}  # field -> _ids in sort order, dropped when the field is written
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def with_options(self, **options):
+        return self
+
+    def index_on(self, *fields):
+        """Answer equality and $in lookups on `fields` from a hash index instead of a full scan.
+
+        Only changes how fast the fake is, so scenario benchmarks with 100k+ documents
+        measure the bot rather than this module.
+        """
+        for field in fields:
+            self._hashed[field] = None  # Built on first use
+
+    def _hash(self, field):
+        if self._hashed[field] is None:
+            index = {}
+            for key, document in self.documents.items():
+                index.setdefault(_get(document, field), set()).add(key)
+            self._hashed[field] = index
+        return self._hashed[field]
+
+    def _index(self, document, add=True):
+        for field, index in self._hashed.items():
+            if index is None:
+                continue
+            if add:
+                index.setdefault(_get(document, field), set()).add(document["_id"])
+            else:
+                index.get(_get(document, field), set()).discard(document["_id"])
+
+    def _store(self, document):
+        self.documents[document["_id"]] = document
+        self._index(document)
+        self._sorted.clear()
+
+    def _remove(self, key):
+        self._index(self.documents.pop(key), add=False)
+        self._sorted.clear()
+
+    def _write(self, document, update):
+        """Apply `update` to a stored document, keeping the indexes current."""
+        fields = [field for fields in update.values() for field in fields]
+        indexed = any(field in self._hashed for field in fields)
+        if indexed:
+            self._index(document, add=False)
+        _apply_update(document, update)
+        if indexed:
+            self._index(document)
+        for field in fields:
+            self._sorted.pop(field, None)
+
+    def _candidates(self, query):
+        """_ids that can match `query`, or None when every document has to be checked."""
+        if "_id" in query and not isinstance(query["_id"], dict):
+            return {query["_id"]}
+        for field, condition in query.items():
+            if field not in self._hashed:
+                continue
+            if isinstance(condition, dict):
+                if set(condition) != {"$in"}:
+                    continue
+                values = condition["$in"]
+            else:
+                values = [condition]
+            index = self._hash(field)
+            return set().union(*(index.get(value, ()) for value in values))
+        if "$or" in query:
+            branches = [self._candidates(branch) for branch in query["$or"]]
+            if all(branch is not None for branch in branches):
+                return set().union(*branches)
+        return None
+
+    def _scan(self, query=None, sort=None):
+        query = query or {}
+        candidates = self._candidates(query)
+        if sort:
+            key, direction = sort[0]
+            if key not in self._sorted:
+                self._sorted[key] = sorted(
+                    self.documents, key=lambda i: (_get(self.documents[i], key) is None, _get(self.documents[i], key))
+                )
+            order = self._sorted[key] if direction > 0 else reversed(self._sorted[key])
+            keys = (i for i in order if candidates is None or i in candidates)
+        else:
+            keys = self.documents if candidates is None else candidates
+        matches = _compile(query)
+        for key in keys:
+            document = self.documents.get(key)
+            if document is not None and matches(document):
+                yield document
+
+    def _find(self, query=None, projection=None):
+        return [_project(d, projection) for d in self._scan(query)]
+
+    def find(self, query=None, projection=None):
+        # Projection is applied when results are read so sort() can use any field
+        return FakeCursor(self, self._find(query), projection)
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        await self._round_trip()
+        if isinstance(sort, str):
+            sort = [(sort, 1)]
+        document = next(self._scan(query, sort), None)
+        return _project(document, projection) if document is not None else None
+
+    async def count_documents(self, query):
+        await self._round_trip()
+        return len(self._find(query))
+
+    async def insert_one(self, document):
+        await self._round_trip()
+        document.setdefault("_id", next(_ids))
+        self._store(copy.deepcopy(document))
+        return FakeResult(inserted_id=document["_id"])
+
+    async def insert_many(self, documents, ordered=True):
+        await self._round_trip()
+        for document in documents:
+            document.setdefault("_id", next(_ids))
+            self._store(copy.deepcopy(document))
+        return FakeResult(inserted_ids=[d["_id"] for d in documents])
+
+    def _update(self, query, update, upsert=False, many=False):
+        matched = list(self._scan(query)) if many else list(itertools.islice(self._scan(query), 1))
+        for document in matched:
+            self._write(document, update)
+        upserted_id = None
+        if not matched and upsert:
+            document = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            document.setdefault("_id", next(_ids))
+            _apply_update(document, update)
+            for key, value in update.get("$setOnInsert", {}).items():
+                document.setdefault(key, value)
+            self._store(document)
+            upserted_id = document["_id"]
+        return FakeResult(matched_count=len(matched), modified_count=len(matched), upserted_id=upserted_id)
+
+    async def update_one(self, query, update, upsert=False):
+        await self._round_trip()
+        return self._update(query, update, upsert)
+
+    async def update_many(self, query, update, upsert=False):
+        await self._round_trip()
+        return self._update(query, update, upsert, many=True)
+
+    async def find_one_and_update(self, query, update, sort=None, projection=None, upsert=False, return_document=False):
+        await self._round_trip()
+        document = next(self._scan(query, sort), None)
+        if document is None:
+            if not upsert:
+                return None
+            result = self._update(query, update, upsert=True)
+            return _project(self.documents[result.upserted_id], projection) if return_document else None
+        before = copy.deepcopy(document)
+        self._write(document, update)
+        return _project(document if return_document else before, projection)
+
+    async def bulk_write(self, requests, ordered=True):
+        await self._round_trip()
+        matched = modified = 0
+        for request in requests:
+            # pymongo.UpdateOne keeps its arguments in private slots
+            result = self._update(request._filter, request._doc, upsert=bool(request._upsert))
+            matched += result.matched_count
+            modified += result.modified_count
+        return FakeResult(matched_count=matched, modified_count=modified)
+
+    async def delete_one(self, query):
+        await self._round_trip()
+        document = next(self._scan(query), None)
+        if document is None:
+            return FakeResult(deleted_count=0)
+        self._remove(document["_id"])
+        return FakeResult(deleted_count=1)
+
+    async def delete_many(self, query):
+        await self._round_trip()
+        doomed = [document["_id"] for document in self._scan(query)]
+        for key in doomed:
+            self._remove(key)
+        return FakeResult(deleted_count=len(doomed))
+
+    async def create_index(self, keys, **options):
+        self.indexes.append((keys, options))
+        return str(keys)
+
+    def aggregate(self, pipeline):
+        if pipeline and "$match" in pipeline[0]:
+            documents = [copy.deepcopy(d) for d in self._scan(pipeline[0]["$match"])]
+            pipeline = pipeline[1:]
+        else:
+            documents = [copy.deepcopy(d) for d in self.documents.values()]
+        for stage in pipeline:
+            (op, spec), = stage.items()
+            if op == "$match":
+                documents = [d for d in documents if _matches(d, spec)]
+            elif op == "$sort":
+                for key, direction in reversed(list(spec.items())):
+                    documents.sort(key=lambda d: _get(d, key), reverse=direction < 0)
+            elif op == "$skip":
+                documents = documents[spec:]
+            elif op == "$limit":
+                documents = documents[:spec]
+            elif op == "$lookup":
+                foreign = self.database[spec["from"]]
+                for document in documents:
+                    local = _get(document, spec["localField"])
+                    document[spec["as"]] = [
+                        copy.deepcopy(f) for f in foreign._scan({spec["foreignField"]: local})
+                    ]
+            elif op == "$unwind":
+                path = spec.lstrip("$")
+                documents = [dict(d, **{path: item}) for d in documents for item in d.get(path, [])]
+            elif op == "$project":
+                projected = []
+                for document in documents:
+                    result = {}
+                    for key, value in spec.items():
+                        if isinstance(value, str) and value.startswith("$"):
+                            result[key] = _get(document, value[1:])
+                        elif value:
+                            result[key] = _get(document, key)
+                    projected.append(result)
+                documents = projected
+            else:
+                raise NotImplementedError(op)
+        return FakeCursor(self, documents)
+
+
+class FakeDatabase:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name, self, self.latency)
+        return self.collections[name]
+
+    @property
+    def round_trips(self):
+        return sum(collection.round_trips for collection in self.collections.values())
+
+    def reset_round_trips(self):
+        for collection in self.collections.values():
+            collection.round_trips = 0
+
+
+class FakeCatalogue:
+    """Deterministic product prices behind fake ExtractAmazon/ExtractFlipkart classes.
+
+    Every `next_round` changes the price of the same share of products for a given
+    seed; the extractors block for `latency` seconds (jittered) like a page download
+    and remember when each product was last scraped.
+    """
+
+    def __init__(self, urls, change_rate=0.05, latency=0.0, seed=1):
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.change_rate = change_rate
+        self.prices = {url: self.rng.randrange(200, 50000) for url in urls}
+        self.scraped_at = {}
+        self.scrapes = 0
+
+    def price(self, url):
+        """Current price of a product page; products not in the catalogue yet get a stable one."""
+        url = url.split("?")[0]  # Affiliate parameters
+        if url not in self.prices:
+            self.prices[url] = random.Random(url).randrange(200, 50000)
+        return self.prices[url]
+
+    def next_round(self):
+        """Move the price of `change_rate` of the products up or down; returns their urls."""
+        changed = self.rng.sample(sorted(self.prices), int(len(self.prices) * self.change_rate))
+        for url in changed:
+            step = max(1, self.prices[url] * self.rng.randrange(2, 20) // 100)
+            self.prices[url] += step if self.rng.random() < 0.5 else -step
+        return changed
+
+    def extractor(self):
+        """A class with the ExtractAmazon/ExtractFlipkart methods the scrapers call."""
+        catalogue = self
+
+        class FakeExtractor:
+            soup = None
+
+            def __init__(self, url):
+                if catalogue.latency:
+                    time.sleep(catalogue.latency * random.uniform(0.5, 1.5))
+                self.url = url.split("?")[0]  # Affiliate parameters
+                catalogue.scrapes += 1
+                catalogue.scraped_at[self.url] = time.monotonic()
+
+            def get_title(self):
+                return f"Fake product {self.url.rsplit('/', 1)[-1]}"
+
+            def get_price(self):
+                return f"₹{catalogue.price(self.url):,}"
+
+            def is_available(self):
+                return True
+
+            def get_images(self):
+                return [f"https://images.example/{self.url.rsplit('/', 1)[-1]}.jpg"]
+
+        return FakeExtractor
+
+
+class FakeClient:
+    """Pyrogram client stand-in that records sends; raises FloodWait for a share of calls and fails for blocked users."""
+
+    def __init__(self, latency=0.0, flood_rate=0.0, blocked=(), rng=None):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.blocked = set(blocked)
+        self.rng = rng or random.Random(5)
+        self.sent = []  # (chat_id, text, monotonic time)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            from pyrogram.errors import FloodWait
+            raise FloodWait(value=1)
+        if chat_id in self.blocked:
+            raise RuntimeError("USER_IS_BLOCKED")
+        self.sent.append((chat_id, text, time.monotonic()))
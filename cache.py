@@ -0,0 +1,144 @@
+# cache.py
+
+import datetime
+import logging
+import os
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+import db
+
+load_dotenv()
+
+# Write concern of cache writes; entries can be recomputed, so they need not wait for a majority
+CACHE_WRITE_CONCERN = os.getenv("CACHE_WRITE_CONCERN", "1")
+# Second level, shared by every process; entries are removed by a TTL index on expires_at
+CACHE = db.collection(os.getenv("CACHE", "Cache"), w=CACHE_WRITE_CONCERN)
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 10000))  # Per in-process cache
+EXPANDED_URL_TTL = int(os.getenv("EXPANDED_URL_TTL", 7 * 86400))
+AFFILIATE_LINK_TTL = int(os.getenv("AFFILIATE_LINK_TTL", 86400))
+SCRAPE_RESULT_TTL = int(os.getenv("SCRAPE_RESULT_TTL", 600))
+
+
+class LRUCache:
+    """In-process cache with a size limit (least recently used entries go first) and a TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TieredCache:
+    """An LRUCache in front of the shared Mongo cache collection.
+
+    Keys are namespaced with the cache name, so several caches share one collection.
+    None is never cached, which lets loaders signal failure.
+    """
+
+    def __init__(self, name, ttl, maxsize=CACHE_MAX_ENTRIES, collection=CACHE):
+        self.name = name
+        self.ttl = ttl
+        self.collection = collection
+        self.local = LRUCache(maxsize, ttl)
+        self.hits = {"memory": 0, "mongo": 0}
+        self.misses = 0
+
+    def _id(self, key):
+        return f"{self.name}:{key}"
+
+    async def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self.hits["memory"] += 1
+            return value
+
+        try:
+            entry = await self.collection.find_one(
+                {"_id": self._id(key), "expires_at": {"$gt": datetime.datetime.now(datetime.timezone.utc)}},
+                {"value": 1},
+            )
+        except Exception as e:
+            logging.error("Error reading %s cache: %s", self.name, e)
+            entry = None
+
+        if entry is not None:
+            self.hits["mongo"] += 1
+            self.local.set(key, entry["value"])
+            return entry["value"]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key, value):
+        if value is None:
+            return
+        self.local.set(key, value)
+        try:
+            await self.collection.update_one(
+                {"_id": self._id(key)},
+                {"$set": {
+                    "value": value,
+                    "expires_at": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=self.ttl),
+                }},
+                upsert=True,
+            )
+        except Exception as e:
+            logging.error("Error writing %s cache: %s", self.name, e)
+
+    async def get_or_load(self, key, loader):
+        """Return the cached value for `key`, otherwise await `loader()` and cache its result."""
+        if key is None:
+            return await loader()
+        value = await self.get(key)
+        if value is None:
+            value = await loader()
+            await self.set(key, value)
+        return value
+
+    def stats(self):
+        lookups = sum(self.hits.values()) + self.misses
+        return {
+            "name": self.name,
+            "memory_hits": self.hits["memory"],
+            "mongo_hits": self.hits["mongo"],
+            "misses": self.misses,
+            "hit_rate": sum(self.hits.values()) / lookups if lookups else 0.0,
+            "entries": len(self.local),
+        }
+
+
+# Short link -> expanded URL (keyed by the link as sent, it cannot be resolved without expanding)
+expanded_urls = TieredCache("expanded_url", EXPANDED_URL_TTL)
+# Canonical product key -> EarnKaro affiliate link
+affiliate_links = TieredCache("affiliate_link", AFFILIATE_LINK_TTL)
+# Canonical product key -> [product_name, price, availability, image_url]
+scrape_results = TieredCache("scrape_result", SCRAPE_RESULT_TTL)
+
+CACHES = (expanded_urls, affiliate_links, scrape_results)
+
+
+def cache_stats():
+    """Hit-rate counters of every cache, for logs and the admin stats command."""
+    return [cache.stats() for cache in CACHES]
@@ -0,0 +1,136 @@
+# db.py
+#
+# The one Mongo client of the process. Modules take collection handles from here at
+# import time; the client behind them (one connection pool, one topology monitor) is
+# only created on first use or by `connect()`, inside the event loop that uses it.
+# `close()` shuts it down.
+
+import logging
+import os
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference
+from pymongo.write_concern import WriteConcern
+
+load_dotenv()
+
+
+MONGO_URI = os.getenv("MONGO_URI")
+DATABASE = os.getenv("DATABASE")
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))  # Connections per server
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))  # Kept open while idle
+MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", 300000))  # Idle connections closed after this
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 0)) or None  # 0: no limit
+# primary, primaryPreferred, secondary, secondaryPreferred or nearest
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+# w of every write ("majority", a number, or empty for the server default)
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "")
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+_client = None
+_database = None
+
+
+def _w(value):
+    return int(value) if value.isdigit() else value
+
+
+def write_concern(w):
+    """WriteConcern for a `w` setting as found in the environment ("majority", "1", ...)."""
+    return WriteConcern(w=_w(w)) if w else None
+
+
+def get_client():
+    """The shared Motor client (created on first use)."""
+    global _client
+    if _client is None:
+        options = dict(
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            readPreference=MONGO_READ_PREFERENCE,
+        )
+        if MONGO_WRITE_CONCERN:
+            options["w"] = _w(MONGO_WRITE_CONCERN)
+        _client = AsyncIOMotorClient(MONGO_URI, **options)
+        logging.info("Mongo client created (pool %s-%s).", MONGO_MIN_POOL_SIZE, MONGO_MAX_POOL_SIZE)
+    return _client
+
+
+def get_database():
+    """The bot's database on the shared client, or the one set with `use_database`."""
+    global _database
+    if _database is None:
+        _database = get_client()[DATABASE]
+    return _database
+
+
+def use_database(database):
+    """Resolve every handle against `database` instead (e.g. another database, or a fake in benchmarks)."""
+    global _database
+    _database = database
+    _Handle.generation += 1
+
+
+class _Handle:
+    """A collection that is looked up on the shared database when first used."""
+
+    generation = 0  # Bumped whenever the database behind the handles changes
+
+    def __init__(self, name, options):
+        self.name = name
+        self._options = options
+        self._collection = None
+        self._generation = -1
+
+    def _resolve(self):
+        if self._collection is None or self._generation != _Handle.generation:
+            collection = get_database()[self.name]
+            self._collection = collection.with_options(**self._options) if self._options else collection
+            self._generation = _Handle.generation
+        return self._collection
+
+    def __getattr__(self, attribute):
+        return getattr(self._resolve(), attribute)
+
+    def __repr__(self):
+        return f"<collection {self.name}>"
+
+
+def collection(name, w=None, read_preference=None):
+    """Handle to a collection; `w` / `read_preference` override the client defaults for its operations."""
+    options = {}
+    if w:
+        options["write_concern"] = write_concern(w)
+    if read_preference:
+        options["read_preference"] = READ_PREFERENCES[read_preference]
+    return _Handle(name, options)
+
+
+async def connect():
+    """Create the client and wait until the server answers; called once when a process starts."""
+    await get_database().command("ping")
+    logging.info("Mongo connected.")
+
+
+def close():
+    """Close the shared client and its pooled connections; called on shutdown."""
+    global _client, _database
+    if _client is not None:
+        _client.close()
+        logging.info("Mongo client closed.")
+    _client = _database = None
+    _Handle.generation += 1
@@ -0,0 +1,174 @@
+# dispatcher.py
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from pyrogram.errors import FloodWait
+import metrics
+
+load_dotenv()
+
+
+# Telegram allows bots roughly 30 messages/second overall and 1 message/second per chat
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 25))
+TELEGRAM_PER_CHAT_INTERVAL = float(os.getenv("TELEGRAM_PER_CHAT_INTERVAL", 1.0))
+TELEGRAM_SEND_WORKERS = int(os.getenv("TELEGRAM_SEND_WORKERS", 16))
+# Times a message is retried after FloodWait before it counts as failed
+TELEGRAM_FLOOD_RETRIES = int(os.getenv("TELEGRAM_FLOOD_RETRIES", 3))
+
+
+class RateLimiter:
+    """Spaces calls `interval` seconds apart; `pause` holds everyone back (used for FloodWait)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(now, self._next_slot, self._paused_until)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class DeliveryStats:
+    """Outbound message counters, overall and per tag (e.g. "alert", "broadcast")."""
+
+    def __init__(self):
+        self.sent = {}
+        self.failed = {}
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0.0
+
+    def record(self, tag, ok):
+        counter = self.sent if ok else self.failed
+        counter[tag] = counter.get(tag, 0) + 1
+        metrics.MESSAGES.inc(tag=tag, outcome="sent" if ok else "failed")
+
+    def summary(self):
+        tags = sorted(set(self.sent) | set(self.failed))
+        per_tag = ", ".join(f"{tag}: {self.sent.get(tag, 0)} sent / {self.failed.get(tag, 0)} failed" for tag in tags)
+        return (
+            f"Delivered {sum(self.sent.values())}, failed {sum(self.failed.values())}, "
+            f"{self.flood_waits} FloodWaits ({self.flood_wait_seconds:.0f}s) [{per_tag}]"
+        )
+
+
+class MessageDispatcher:
+    """Shared outbound queue for Telegram messages.
+
+    Workers send queued messages within the global and per-chat rate limits and retry
+    on FloodWait; a failing chat never stops the rest of a fan-out. Lower `priority`
+    values go first, so price alerts are not stuck behind a broadcast. `submit` returns
+    a future that resolves to True once the message was delivered, False if it failed.
+    """
+
+    def __init__(self, client, rate=TELEGRAM_GLOBAL_RATE, per_chat_interval=TELEGRAM_PER_CHAT_INTERVAL,
+                 workers=TELEGRAM_SEND_WORKERS):
+        self.client = client
+        self.limiter = RateLimiter(rate)
+        self.per_chat_interval = per_chat_interval
+        self.worker_count = workers
+        self.stats = DeliveryStats()
+        self.queue = asyncio.PriorityQueue()
+        self._order = itertools.count()
+        self._chat_slots = OrderedDict()  # chat_id -> next free slot, least recently used first
+        self._workers = []
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, chat_id, text, tag="message", priority=0, **kwargs):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((priority, next(self._order), (chat_id, text, tag, kwargs, future)))
+        return future
+
+    async def send_many(self, chat_ids, text, tag="message", priority=0, **kwargs):
+        """Queue the same text for every chat and wait; returns (delivered, failed)."""
+        results = await asyncio.gather(
+            *(self.submit(chat_id, text, tag, priority, **kwargs) for chat_id in chat_ids)
+        )
+        delivered = sum(1 for ok in results if ok)
+        return delivered, len(results) - delivered
+
+    async def _wait_for_chat(self, chat_id):
+        now = time.monotonic()
+        # Slots already in the past no longer hold anyone back; forget them so the map only has active chats
+        while self._chat_slots:
+            oldest = next(iter(self._chat_slots))
+            if self._chat_slots[oldest] > now:
+                break
+            del self._chat_slots[oldest]
+        slot = max(now, self._chat_slots.pop(chat_id, now))
+        self._chat_slots[chat_id] = slot + self.per_chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _worker(self):
+        while True:
+            _, _, (chat_id, text, tag, kwargs, future) = await self.queue.get()
+            try:
+                ok = await self._deliver(chat_id, text, kwargs)
+                self.stats.record(tag, ok)
+                if not future.done():
+                    future.set_result(ok)
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, chat_id, text, kwargs):
+        for attempt in range(TELEGRAM_FLOOD_RETRIES + 1):
+            await self._wait_for_chat(chat_id)
+            await self.limiter.acquire()
+            try:
+                await self.client.send_message(chat_id=chat_id, text=text, **kwargs)
+                return True
+            except FloodWait as e:
+                wait = float(e.value or 1)
+                self.stats.flood_waits += 1
+                self.stats.flood_wait_seconds += wait
+                metrics.FLOOD_WAITS.inc(wait)
+                self.limiter.pause(wait)  # Telegram throttles the whole bot, not just this chat
+                logging.warning("FloodWait of %ss while sending to %s (attempt %s)", wait, chat_id, attempt + 1)
+            except Exception as e:
+                logging.error("Failed to send message to %s: %s", chat_id, e)
+                return False
+        return False
+
+
+_dispatchers = {}
+
+metrics.Gauge(
+    "pricetracker_outbox_depth", "Messages waiting in the Telegram dispatcher",
+    callback=lambda: {(): sum(dispatcher.queue.qsize() for dispatcher in list(_dispatchers.values()))},
+)
+
+
+def get_dispatcher(client):
+    """The shared dispatcher for a Pyrogram client, created on first use."""
+    if id(client) not in _dispatchers:
+        _dispatchers[id(client)] = MessageDispatcher(client)
+    return _dispatchers[id(client)]
+
+
+async def stop_dispatchers():
+    for dispatcher in _dispatchers.values():
+        logging.info(dispatcher.stats.summary())
+        await dispatcher.stop()
+    _dispatchers.clear()
@@ -0,0 +1,53 @@
+# events.py
+
+import asyncio
+import logging
+import metrics
+
+
+# Published with the ids of global products whose new price has just been written to Mongo
+PRICE_CHANGED = "price_changed"
+
+
+class EventBus:
+    """In-process publish/subscribe; async handlers run as background tasks so publishers never wait on them."""
+
+    def __init__(self):
+        self.handlers = {}
+        self.pending = set()
+
+    def subscribe(self, event, handler):
+        self.handlers.setdefault(event, []).append(handler)
+
+    def unsubscribe(self, event, handler):
+        if handler in self.handlers.get(event, []):
+            self.handlers[event].remove(handler)
+
+    def publish(self, event, payload):
+        for handler in self.handlers.get(event, []):
+            task = asyncio.create_task(self._run(event, handler, payload))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+
+    async def _run(self, event, handler, payload):
+        try:
+            await handler(payload)
+        except Exception as e:
+            logging.error("Error handling %s event: %s", event, e)
+
+    async def drain(self):
+        """Wait for every handler started so far, e.g. before a sweep reports completion."""
+        while self.pending:
+            await asyncio.gather(*list(self.pending))
+
+
+bus = EventBus()
+subscribe = bus.subscribe
+unsubscribe = bus.unsubscribe
+publish = bus.publish
+drain = bus.drain
+
+metrics.Gauge(
+    "pricetracker_event_handlers_pending", "Event handlers still running, e.g. alerts of written prices",
+    callback=lambda: {(): len(bus.pending)},
+)
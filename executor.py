@@ -0,0 +1,52 @@
+# executor.py
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# "thread" or "process": where the blocking scraper libraries run
+SCRAPE_POOL = os.getenv("SCRAPE_POOL", "thread").lower()
+SCRAPE_POOL_SIZE = int(os.getenv("SCRAPE_POOL_SIZE", 8))
+# Seconds to wait for a single blocking scrape before giving up on it
+SCRAPE_TIMEOUT = float(os.getenv("SCRAPE_TIMEOUT", 30))
+
+_executor = None
+
+
+def get_executor():
+    """Create the scrape pool on first use so importing this module stays cheap."""
+    global _executor
+    if _executor is None:
+        if SCRAPE_POOL == "process":
+            _executor = concurrent.futures.ProcessPoolExecutor(max_workers=SCRAPE_POOL_SIZE)
+        else:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=SCRAPE_POOL_SIZE, thread_name_prefix="scraper"
+            )
+        logging.info("Started %s scrape pool with %s workers", SCRAPE_POOL, SCRAPE_POOL_SIZE)
+    return _executor
+
+
+async def run_blocking(func, *args, timeout=None):
+    """Run a blocking function on the scrape pool without stalling the event loop.
+
+    With the process pool `func` and its arguments must be picklable, so pass
+    module-level functions. Raises `asyncio.TimeoutError` after `timeout` seconds;
+    a thread that is already running cannot be interrupted and finishes in the background.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(get_executor(), func, *args)
+    return await asyncio.wait_for(future, timeout=timeout or SCRAPE_TIMEOUT)
+
+
+def shutdown():
+    """Stop the scrape pool, dropping queued work."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
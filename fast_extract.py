@@ -0,0 +1,79 @@
+# fast_extract.py
+#
+# Price and availability straight from the raw HTML, for the scheduler's periodic checks.
+# Much cheaper than building a BeautifulSoup tree; returns None whenever the page does
+# not look the way we expect, and the caller falls back to the full extractor.
+
+import json
+import re
+
+# schema.org Product data, present on Flipkart product pages
+JSON_LD_PATTERN = re.compile(r'<script[^>]*type="application/ld\+json"[^>]*>(.*?)</script>', re.DOTALL | re.IGNORECASE)
+
+AMAZON_TITLE = 'id="productTitle"'
+AMAZON_ADD_TO_CART = re.compile(r'<input[^>]*\bid="add-to-cart-button"')
+# The places ExtractAmazon.get_price looks, in the same order: (marker, pattern searched after it)
+AMAZON_PRICES = (
+    ('id="priceblock_ourprice"', re.compile(r'>\s*([^<]+?)\s*<')),
+    ('id="corePriceDisplay_desktop_feature_div"', re.compile(r'class="a-price-whole">\s*([\d,]+)')),
+    ('id="corePrice_desktop"', re.compile(r'class="a-offscreen">\s*([^<]+?)\s*<')),
+)
+# Markup searched after a price marker
+PRICE_WINDOW = 3000
+
+
+def _json_ld_offer(html):
+    """(price, in_stock) from the page's schema.org Product offer, or None."""
+    for match in JSON_LD_PATTERN.finditer(html):
+        try:
+            data = json.loads(match.group(1))
+        except ValueError:
+            continue
+        for item in data if isinstance(data, list) else [data]:
+            if not isinstance(item, dict) or item.get("@type") != "Product":
+                continue
+            offers = item.get("offers")
+            offer = offers[0] if isinstance(offers, list) and offers else offers
+            if not isinstance(offer, dict):
+                continue
+            price = offer.get("price", offer.get("lowPrice"))
+            if price in (None, ""):
+                continue
+            in_stock = "outofstock" not in str(offer.get("availability", "")).lower()
+            return str(price), in_stock
+    return None
+
+
+def extract_amazon(html):
+    """(price text, available) in the shape of ExtractAmazon, or None to fall back."""
+    if AMAZON_TITLE not in html:
+        return None  # Not a product page (block page, redirect, new layout)
+    available = AMAZON_ADD_TO_CART.search(html) is not None
+    if not available:
+        return "", False  # The full extractor reports no price for these either
+    for marker, pattern in AMAZON_PRICES:
+        index = html.find(marker)
+        if index < 0:
+            continue
+        match = pattern.search(html, index + len(marker), index + PRICE_WINDOW)
+        if match:
+            return match.group(1).replace(",", "").replace("₹", ""), True
+    return _json_ld_offer(html)
+
+
+def extract_flipkart(html):
+    """(price text, availability) in the shape of the Flipkart extractor, or None to fall back."""
+    offer = _json_ld_offer(html)
+    if offer is None:
+        return None
+    price, in_stock = offer
+    return (price if in_stock else 0), ("In Stock" if in_stock else "Out of Stock")
+
+
+EXTRACTORS = {"amazon": extract_amazon, "flipkart": extract_flipkart}
+
+
+def extract(platform, html):
+    """Fast (price, availability) for a product page, or None when the full extractor is needed."""
+    extractor = EXTRACTORS.get(platform)
+    return extractor(html) if extractor else None
@@ -0,0 +1,150 @@
+# fetcher.py
+
+import hashlib
+import logging
+import os
+import re
+from collections import namedtuple
+from bs4 import BeautifulSoup
+from dotenv import load_dotenv
+import http_client
+from executor import run_blocking
+from resilience import TransientScrapeError, PermanentScrapeError, BlockedError, BLOCK_MARKERS
+
+load_dotenv()
+
+
+# Send conditional requests and skip the parse when the price-relevant part of a page is unchanged
+CONDITIONAL_FETCH = os.getenv("CONDITIONAL_FETCH", "true").lower() in ("1", "true", "yes")
+
+PAGE_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-GB,en-US;q=0.9,en;q=0.8",
+    "Referer": "https://www.google.com/",
+}
+
+# Where the title, price and availability live on each platform's product page
+FRAGMENT_MARKERS = {
+    "amazon": (
+        'id="productTitle"',
+        'id="corePriceDisplay_desktop_feature_div"',
+        'id="corePrice_desktop"',
+        'id="priceblock_ourprice"',
+        'id="availability"',
+        'id="add-to-cart-button"',
+    ),
+    # Flipkart's class names are generated, so its prices are picked up by PRICE_PATTERN instead
+    "flipkart": ("<h1", "Sold Out"),
+}
+# Characters of markup read after a marker, and of visible text kept from them
+FRAGMENT_WINDOW = 2000
+FRAGMENT_TEXT = 120
+# Leading rupee amounts included in the fingerprint; the product's own price comes first
+FRAGMENT_PRICES = 10
+
+PRICE_PATTERN = re.compile(r"₹\s?[\d,]+(?:\.\d+)?")
+SCRIPT_PATTERN = re.compile(r"<(script|style)\b.*?(?:</\1>|$)", re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r"<[^>]*>")
+SPACE_PATTERN = re.compile(r"\s+")
+
+Page = namedtuple("Page", ["changed", "html", "state"])
+
+
+class FetchStats:
+    """Per sweep counts of how many pages could skip the download or the parse."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.not_modified = 0
+        self.unchanged = 0
+        self.fast = 0
+        self.bytes = 0
+
+    @property
+    def parsed(self):
+        return self.requests - self.not_modified - self.unchanged
+
+    def summary(self):
+        return (
+            f"Fetched {self.requests} pages ({self.bytes / 1048576:.1f} MB): {self.not_modified} not modified, "
+            f"{self.unchanged} with an unchanged price fragment, {self.parsed} parsed ({self.fast} by the fast path)"
+        )
+
+
+stats = FetchStats()
+
+
+def _text(markup):
+    markup = SCRIPT_PATTERN.sub(" ", markup)
+    return SPACE_PATTERN.sub(" ", TAG_PATTERN.sub(" ", markup)).strip()
+
+
+def price_fragment(platform, html):
+    """The visible text around a page's title, price and availability; empty when none is found."""
+    parts = []
+    for marker in FRAGMENT_MARKERS.get(platform, ()):
+        index = html.find(marker)
+        if index >= 0:
+            parts.append(marker + " " + _text(html[index:index + FRAGMENT_WINDOW])[:FRAGMENT_TEXT])
+    if platform == "flipkart" and parts:
+        parts.extend(PRICE_PATTERN.findall(html)[:FRAGMENT_PRICES])
+    return "\n".join(parts)
+
+
+def fingerprint(platform, html):
+    fragment = price_fragment(platform, html)
+    return hashlib.sha1(fragment.encode()).hexdigest() if fragment else None
+
+
+def extractor_from_html(extractor_class, html):
+    """An ExtractAmazon/ExtractFlipkart for already downloaded markup, skipping its own request."""
+    extractor = extractor_class.__new__(extractor_class)
+    extractor.soup = BeautifulSoup(html, "lxml")
+    return extractor
+
+
+async def fetch(url, platform, state=None):
+    """Download a product page unless it is unchanged since `state` (the validators of the last fetch).
+
+    Returns a Page whose `changed` is False when the server answered 304 or the price
+    fragment hashes the same as before; `state` is what to store for the next fetch.
+    """
+    state = state or {}
+    headers = dict(PAGE_HEADERS)
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+
+    stats.requests += 1
+    async with http_client.get_session().get(url, headers=headers) as response:
+        if response.status == 304:
+            stats.not_modified += 1
+            return Page(False, None, state)
+        if response.status in (403, 429, 503):
+            raise BlockedError(f"{platform} answered {response.status} for {url}")
+        if response.status in (404, 410):
+            raise PermanentScrapeError(f"{platform} answered {response.status} for {url}")
+        if response.status >= 400:
+            raise TransientScrapeError(f"{platform} answered {response.status} for {url}")
+        body = await response.read()
+        html = body.decode(response.charset or "utf-8", errors="replace")
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+    stats.bytes += len(body)
+
+    digest = await run_blocking(fingerprint, platform, html)
+    if digest is None:
+        head = html[:5000].lower()
+        if any(marker in head for marker in BLOCK_MARKERS):
+            raise BlockedError(f"{platform} served a block page for {url}")
+        logging.debug("No price fragment found on %s, parsing the full page", url)
+
+    new_state = {"etag": etag, "last_modified": last_modified, "fragment": digest}
+    if digest is not None and digest == state.get("fragment"):
+        stats.unchanged += 1
+        return Page(False, None, new_state)
+    return Page(True, html, new_state)
@@ -1,150 +1,339 @@
 #helpers.py
 
-from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+import datetime
 import os
 import logging
+import logs
+import db
 from dotenv import load_dotenv
+from adaptive import CHECK_INTERVAL_MIN
+from urlnorm import product_key, url_platform
+from metrics import timed, MONGO_SECONDS, MONGO_ERRORS
+from history import record_price
+from prices import is_available
 
 load_dotenv()
 
-# Database Connection
-dbclient = AsyncIOMotorClient(os.getenv("MONGO_URI"))
-database = dbclient[os.getenv("DATABASE")]
-collection = database[os.getenv("COLLECTION")]
-PRODUCTS = database[os.getenv("PRODUCTS")]
+# Collections on the shared client (db.py)
+collection = db.collection(os.getenv("COLLECTION"))
+PRODUCTS = db.collection(os.getenv("PRODUCTS"))
+USERS = db.collection("Users")
+# Price changes waiting for the next digest of a digest-mode user
+DIGESTS = db.collection(os.getenv("DIGESTS", "Digests"))
+
+
+# Query for the trackings of a product that want to hear about a move from previous_price to price
+def alert_filter(product_id, previous_price, price):
+    if not is_available(price):
+        # Going out of stock is not a drop: only trackings without price thresholds hear about it
+        return {"product_id": product_id, "target_price": None, "min_drop_pct": None, "drops_only": {"$ne": True}}
+    query = {
+        "product_id": product_id,
+        "$or": [{"target_price": None}, {"target_price": {"$gte": price}}],
+    }
+    if price > previous_price:
+        query["drops_only"] = {"$ne": True}
+        query["min_drop_pct"] = None
+    elif is_available(previous_price):
+        drop_pct = (previous_price - price) * 100 / previous_price
+        query["$and"] = [{"$or": [{"min_drop_pct": None}, {"min_drop_pct": {"$lte": drop_pct}}]}]
+    return query
+
+
+# Users to alert for each (product_id, previous_price, price) change, with every threshold checked by Mongo
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
+async def fetch_alert_subscribers(changes):
+    changes = list(changes)
+    subscribers = {product_id: [] for product_id, _, _ in changes}
+    if not changes:
+        return subscribers
+
+    try:
+        cursor = collection.find(
+            {"$or": [alert_filter(*change) for change in changes]},
+            {"_id": 0, "product_id": 1, "user_id": 1},
+        )
+        async for tracking in cursor:
+            subscribers.setdefault(tracking["product_id"], []).append(tracking["user_id"])
+    except Exception as e:
+        logging.error("Error fetching subscribers: %s", e)
+
+    return subscribers
+
+
+# Set or clear the alert thresholds of one of the user's trackings; None removes a setting
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
+async def update_alert_settings(tracking_id, user_id, settings):
+    set_fields = {key: value for key, value in settings.items() if value is not None}
+    unset_fields = {key: "" for key, value in settings.items() if value is None}
+    update = {}
+    if set_fields:
+        update["$set"] = set_fields
+    if unset_fields:
+        update["$unset"] = unset_fields
+    try:
+        result = await collection.update_one({"_id": ObjectId(tracking_id), "user_id": user_id}, update)
+        return result.matched_count > 0
+    except Exception as e:
+        logging.error("Error updating alert settings: %s", e)
+        return False
 
 
-# Fetch all products for a specific user
-async def fetch_all_products(user_id):
+# Users (out of the given ids) who asked for a periodic digest instead of an alert per product
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
+async def fetch_digest_users(user_ids):
     try:
-        cursor = collection.find({"user_id": user_id})
-        products = await cursor.to_list(length=None)
-        global_products = []
+        cursor = USERS.find({"user_id": {"$in": list(user_ids)}, "alert_mode": "digest"}, {"_id": 0, "user_id": 1})
+        return {user["user_id"] async for user in cursor}
+    except Exception as e:
+        logging.error("Error fetching alert modes: %s", e)
+        return set()
 
-        for product in products:
-            global_product = await PRODUCTS.find_one({"_id": product.get("product_id")})
-            if global_product:
-                global_product["product_id"] = product.get("_id")
-                global_products.append(global_product)
 
-        return global_products
+# Switch a user between "instant" alerts and a periodic "digest"
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
+async def set_alert_mode(user_id, mode):
+    try:
+        await USERS.update_one({"user_id": user_id}, {"$set": {"alert_mode": mode}}, upsert=True)
+        return True
     except Exception as e:
-        logging.error(f"Error fetching products: {str(e)}")
+        logging.error("Error updating alert mode: %s", e)
+        return False
+
+
+# Queue (user_id, product) price changes for the users' next digest. A product that changes again before
+# the digest goes out keeps its one entry: the first previous price and the latest price.
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
+async def queue_digest_entries(entries):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    requests = [
+        UpdateOne(
+            {"user_id": user_id, "product_id": product["_id"], "claim": None},
+            {
+                "$set": {
+                    "product_name": product["product_name"],
+                    "affiliate_url": product["affiliate_url"],
+                    "price": product["price"],
+                },
+                "$setOnInsert": {"previous_price": product["previous_price"], "queued_at": now},
+            },
+            upsert=True,
+        )
+        for user_id, product in entries
+    ]
+    if not requests:
+        return
+    try:
+        await DIGESTS.bulk_write(requests, ordered=False)
+    except Exception as e:
+        logging.error("Error queuing digest entries: %s", e)
+
+
+# Reserve every queued digest entry (and any whose earlier claim ran out) for one flush; oldest first
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
+async def claim_digest_entries(lease_seconds):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    claim = ObjectId()
+    try:
+        await DIGESTS.update_many(
+            {"$or": [{"claim": None}, {"claimed_until": {"$lte": now}}]},
+            {"$set": {"claim": claim, "claimed_until": now + datetime.timedelta(seconds=lease_seconds)}},
+        )
+        entries = await DIGESTS.find({"claim": claim}).sort("queued_at", 1).to_list(length=None)
+    except Exception as e:
+        logging.error("Error claiming digest entries: %s", e)
+        return claim, []
+    return claim, entries
+
+
+# Remove the entries of a flush once its digests are sent
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
+async def delete_digest_entries(claim):
+    try:
+        await DIGESTS.delete_many({"claim": claim})
+    except Exception as e:
+        logging.error("Error deleting digest entries: %s", e)
+
+
+# Number of tracked products shown per /my_trackings page
+TRACKINGS_PAGE_SIZE = int(os.getenv("TRACKINGS_PAGE_SIZE", 10))
+
+
+# Fetch all products for a specific user (optionally one page of them) in a single aggregation
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
+async def fetch_all_products(user_id, skip=0, limit=None):
+    try:
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {"$sort": {"_id": 1}},
+        ]
+        if skip:
+            pipeline.append({"$skip": skip})
+        if limit:
+            pipeline.append({"$limit": limit})
+        pipeline += [
+            {"$lookup": {
+                "from": PRODUCTS.name,
+                "localField": "product_id",
+                "foreignField": "_id",
+                "as": "product",
+            }},
+            {"$unwind": "$product"},
+            # Only the fields the tracking list needs; product_id is the tracking id
+            {"$project": {
+                "_id": "$product._id",
+                "product_id": "$_id",
+                "product_name": "$product.product_name",
+                "affiliate_url": "$product.affiliate_url",
+                "price": "$product.price",
+            }},
+        ]
+        return await collection.aggregate(pipeline).to_list(length=None)
+    except Exception as e:
+        logging.error("Error fetching products: %s", e)
         return []
 
+
+# Count the products a user is tracking (used to paginate /my_trackings)
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
+async def count_tracked_products(user_id):
+    try:
+        return await collection.count_documents({"user_id": user_id})
+    except Exception as e:
+        logging.error("Error counting products: %s", e)
+        return 0
+
 # Fetch a specific product by ID
 
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
 async def fetch_one_product(tracking_id):
     try:
         # Find the product in PriceTracker using the tracking ID
         product = await collection.find_one({"_id": ObjectId(tracking_id)})
         return product if product else None
     except Exception as e:
-        logging.error(f"Error fetching product: {str(e)}")
+        logging.error("Error fetching product: %s", e)
         return None
 
 
 
 
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
 async def fetch_global_product(product_id):
     try:
         # Find the product in PriceTrackerGlobal using the product_id
         global_product = await PRODUCTS.find_one({"_id": ObjectId(product_id)})
         return global_product if global_product else None
     except Exception as e:
-        logging.error(f"Error fetching global product: {str(e)}")
+        logging.error("Error fetching global product: %s", e)
         return None
 
 
 
 # Add a new product to the database
-# Add a new product to the database with checks for duplicates by product name
+# Add a new product to the database with checks for duplicates by canonical product key (ASIN / Flipkart pid)
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
 async def add_new_product(user_id, product_name, original_url, affiliate_url, initial_price):
     try:
-        # Check if the product is already present in pricetrackerglobal by product name
-        existing_global_product = await PRODUCTS.find_one({"product_name": product_name})
-
-        if not existing_global_product:
-            # If the product does not exist globally, add it to the pricetrackerglobal collection
-            global_new_product = {
-                "product_name": product_name,
-                "url": original_url,  # Store a single URL
-                "affiliate_url": affiliate_url,  # Store a single affiliate URL
-                "price": initial_price,
-                "previous_price": initial_price,
-                "upper": initial_price,
-                "lower": initial_price,
-            }
-            insert_result = await PRODUCTS.insert_one(global_new_product)
-            new_product_id = insert_result.inserted_id
-            logging.info(f"New global product added: {product_name}")
-        else:
-            # If the product already exists globally, replace the old URL and affiliate link with the new one
-            new_product_id = existing_global_product["_id"]
-
-            # Update the product in pricetrackerglobal with the new URL and affiliate link
-            await PRODUCTS.update_one(
-                {"_id": new_product_id},
-                {"$set": {
-                    "url": original_url,
-                    "affiliate_url": affiliate_url
-                }}
-            )
-            logging.info(f"Global product {product_name} updated with new URL and affiliate link.")
-
-        # Check if the user is already tracking this product
-        existing_user_product = await collection.find_one({"user_id": user_id, "product_id": new_product_id})
+        global_new_product = {
+            "product_name": product_name,
+            "price": initial_price,
+            "previous_price": initial_price,
+            "upper": initial_price,
+            "lower": initial_price,
+            "trackers": 0,
+            # Just scraped, so the first scheduled check can wait one minimum interval
+            "next_check_at": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=CHECK_INTERVAL_MIN),
+        }
+        identity = product_key(original_url)
 
-        if existing_user_product:
+        if identity:
+            # Insert or refresh in one atomic step, deduplicated by the unique (platform, product_key) index
+            platform, key = identity
+            global_product = await PRODUCTS.find_one_and_update(
+                {"platform": platform, "product_key": key},
+                {
+                    "$set": {
+                        "url": original_url,  # Store a single URL
+                        "affiliate_url": affiliate_url,  # Store a single affiliate URL
+                    },
+                    "$setOnInsert": global_new_product,
+                },
+                projection={"_id": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            new_product_id = global_product["_id"]
+            logging.info("Global product %s:%s stored: %s", platform, key, product_name)
+        else:
+            # Links without an ASIN / pid fall back to matching by product name
+            existing_global_product = await PRODUCTS.find_one({"product_name": product_name})
+
+            if not existing_global_product:
+                # If the product does not exist globally, add it to the pricetrackerglobal collection
+                global_new_product.update({
+                    "platform": url_platform(original_url),
+                    "product_key": None,  # No recognisable key; keeps the product out of the key migration
+                    "url": original_url,  # Store a single URL
+                    "affiliate_url": affiliate_url,  # Store a single affiliate URL
+                })
+                insert_result = await PRODUCTS.insert_one(global_new_product)
+                new_product_id = insert_result.inserted_id
+                logging.info("New global product added: %s", product_name)
+            else:
+                # If the product already exists globally, replace the old URL and affiliate link with the new one
+                new_product_id = existing_global_product["_id"]
+
+                # Update the product in pricetrackerglobal with the new URL and affiliate link
+                await PRODUCTS.update_one(
+                    {"_id": new_product_id},
+                    {"$set": {
+                        "url": original_url,
+                        "affiliate_url": affiliate_url
+                    }}
+                )
+                logging.info("Global product %s updated with new URL and affiliate link.", product_name)
+
+        # First point of the product's price history (a no-op when today's bucket already exists)
+        await record_price(new_product_id, initial_price)
+
+        # Link the user to the product in one atomic step, deduplicated by the unique (user_id, product_id) index
+        tracking = {"user_id": user_id, "product_id": new_product_id}
+        result = await collection.update_one(tracking, {"$setOnInsert": tracking}, upsert=True)
+
+        if result.upserted_id is None:
             # If the user is already tracking the product, notify them
-            logging.info(f"User {user_id} is already tracking the product {product_name}.")
+            existing_user_product = await collection.find_one(tracking, {"_id": 1})
+            logging.info("User %s is already tracking the product %s.", user_id, product_name)
             return existing_user_product["_id"], False  # False indicates it's already being tracked
 
-        # If the user is not tracking the product, create a new link in the user's collection
-        new_user_product = {
-            "user_id": user_id,
-            "product_id": new_product_id,
-        }
-        result = await collection.insert_one(new_user_product)
+        await PRODUCTS.update_one({"_id": new_product_id}, {"$inc": {"trackers": 1}})
 
-        logging.info(f"Product {product_name} added successfully for user {user_id}.")
-        return result.inserted_id, True  # True indicates a new tracking was created
+        logging.info("Product %s added successfully for user %s.", product_name, user_id)
+        return result.upserted_id, True  # True indicates a new tracking was created
 
     except Exception as e:
-        logging.error(f"Error adding product: {str(e)}")
+        logging.error("Error adding product: %s", e)
         return None, None
 
 
-# Update the product price in the database
+# Update the product price in the database (upper/lower are recomputed by Mongo, no read needed)
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
 async def update_product_price(id, new_price):
+    update = {"$set": {"price": new_price}}
+    if is_available(new_price):
+        update.update({"$max": {"upper": new_price}, "$min": {"lower": new_price}})
     try:
-        global_product = await PRODUCTS.find_one({"_id": id})
-        if global_product:
-            upper_price = global_product.get("upper", new_price)
-            lower_price = global_product.get("lower", new_price)
-
-            if new_price > upper_price:
-                upper_price = new_price
-            if new_price < lower_price:
-                lower_price = new_price
-
-            # Ensure the database update operation is awaited
-            await PRODUCTS.update_one(
-                {"_id": id},
-                {
-                    "$set": {
-                        "price": new_price,
-                        "upper": upper_price,
-                        "lower": lower_price,
-                    }
-                },
-            )
-            logging.info(f"Global product prices updated successfully for {id}.")
+        result = await PRODUCTS.update_one({"_id": id}, update)
+        if result.matched_count:
+            logs.sampled(logging.INFO, "Global product prices updated successfully for %s.", id)
     except Exception as e:
-        logging.error(f"Error updating product price: {str(e)}")
+        logging.error("Error updating product price: %s", e)
         
 
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
 async def delete_one(tracking_id, user_id):
     try:
         # Convert tracking_id to ObjectId if necessary
@@ -154,7 +343,10 @@ async def delete_one(tracking_id, user_id):
         user_product = await collection.find_one({"_id": tracking_object_id, "user_id": user_id})
 
         if not user_product:
-            logging.warning(f"Failed to find product {tracking_id} for user {user_id}. Product not found in pricetracker.")
+            logging.warning(
+                "Failed to find product %s for user %s. Product not found in pricetracker.",
+                tracking_id, user_id,
+            )
             return False
 
         # Get the product_id for global product lookup
@@ -164,30 +356,29 @@ async def delete_one(tracking_id, user_id):
         result = await collection.delete_one({"_id": tracking_object_id, "user_id": user_id})
 
         if result.deleted_count > 0:
-            logging.info(f"Product {tracking_id} successfully deleted for user {user_id} from pricetracker.")
+            logging.info("Product %s successfully deleted for user %s from pricetracker.", tracking_id, user_id)
+            await PRODUCTS.update_one({"_id": ObjectId(product_id)}, {"$inc": {"trackers": -1}})
 
             # Check if any other users are still tracking the product
-            user_tracking = await collection.find_one({"product_id": ObjectId(product_id)})
-
-            # Fetch the product from pricetrackerglobal
-            global_product = await PRODUCTS.find_one({"_id": ObjectId(product_id)})
-
-            logging.info(f"Global Product: {global_product}")
-            logging.info(f"Users still tracking: {user_tracking}")
+            user_tracking = await collection.find_one({"product_id": ObjectId(product_id)}, {"_id": 1})
 
             # If no users are tracking it, delete it from pricetrackerglobal
-            if not user_tracking and global_product:
-                await PRODUCTS.delete_one({"_id": ObjectId(product_id)})
-                logging.info(f"Product {product_id} deleted from pricetrackerglobal as no users are tracking it.")
+            if not user_tracking:
+                result = await PRODUCTS.delete_one({"_id": ObjectId(product_id)})
+                if result.deleted_count:
+                    logging.info("Product %s deleted from pricetrackerglobal as no users are tracking it.", product_id)
 
             return True  # Successfully deleted from pricetracker (and possibly pricetrackerglobal)
 
         else:
-            logging.warning(f"Failed to delete product {tracking_id} for user {user_id}. Product not found in pricetracker.")
+            logging.warning(
+                "Failed to delete product %s for user %s. Product not found in pricetracker.",
+                tracking_id, user_id,
+            )
             return False  # Product was not found in pricetracker
 
     except Exception as e:
-        logging.error(f"Error deleting product {tracking_id} for user {user_id}: {str(e)}")
+        logging.error("Error deleting product %s for user %s: %s", tracking_id, user_id, e)
         return False
 
 
@@ -0,0 +1,139 @@
+# history.py
+
+import datetime
+import logging
+import os
+from pymongo import UpdateOne
+import db
+from prices import is_available
+from metrics import timed, MONGO_SECONDS, MONGO_ERRORS
+
+# One bucket document per product per day holding running aggregates and the raw changes.
+# Besides every change, the price is recorded when tracking starts and once a day while it
+# holds, so every day a product was checked has a bucket.
+PRICE_HISTORY = db.collection(os.getenv("PRICE_HISTORY", "PriceHistory"))
+
+# Raw changes kept inside a single daily bucket
+MAX_CHANGES_PER_BUCKET = int(os.getenv("HISTORY_MAX_CHANGES_PER_BUCKET", 48))
+# Buckets older than this keep only their aggregates (min/max/sum/count/first/last)
+HISTORY_DETAIL_DAYS = int(os.getenv("HISTORY_DETAIL_DAYS", 30))
+# Buckets are removed by a TTL index after this many days
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", 365))
+
+
+def bucket_day(moment):
+    """Start (UTC) of the day whose bucket holds `moment`."""
+    return datetime.datetime(moment.year, moment.month, moment.day, tzinfo=datetime.timezone.utc)
+
+
+def history_update(product_id, price, observed_at=None):
+    """Build the upsert that folds one observed price into the product's daily bucket."""
+    observed_at = observed_at or datetime.datetime.now(datetime.timezone.utc)
+    day = bucket_day(observed_at)
+    return UpdateOne(
+        {"product_id": product_id, "day": day},
+        {
+            "$inc": {"count": 1, "sum": price},
+            "$min": {"min": price},
+            "$max": {"max": price},
+            "$set": {
+                "last": price,
+                "expires_at": day + datetime.timedelta(days=HISTORY_RETENTION_DAYS),
+            },
+            "$setOnInsert": {"first": price},
+            "$push": {"changes": {"$each": [{"at": observed_at, "price": price}], "$slice": -MAX_CHANGES_PER_BUCKET}},
+        },
+        upsert=True,
+    )
+
+
+def history_observation(product_id, price, observed_at=None):
+    """Build the upsert that records an unchanged price, unless the day's bucket already has one."""
+    observed_at = observed_at or datetime.datetime.now(datetime.timezone.utc)
+    day = bucket_day(observed_at)
+    return UpdateOne(
+        {"product_id": product_id, "day": day},
+        {"$setOnInsert": {
+            "count": 1, "sum": price, "min": price, "max": price, "first": price, "last": price,
+            "expires_at": day + datetime.timedelta(days=HISTORY_RETENTION_DAYS),
+            "changes": [{"at": observed_at, "price": price}],
+        }},
+        upsert=True,
+    )
+
+
+async def record_price(product_id, price):
+    """Record a product's price when tracking starts."""
+    if not is_available(price):
+        return
+    try:
+        await PRICE_HISTORY.bulk_write([history_observation(product_id, price)])
+    except Exception as e:
+        logging.error("Error recording price history: %s", e)
+
+
+# Cutoff of this process's last downsampling run; the window only moves once a day
+_downsampled_before = None
+
+
+async def downsample_history():
+    """Drop the raw change lists from buckets past the detail window (at most once a day).
+
+    The first run in a process covers every old bucket; later runs only the days that
+    left the detail window since, so sweeps every few minutes do not rescan the history.
+    """
+    global _downsampled_before
+    cutoff = bucket_day(datetime.datetime.now(datetime.timezone.utc)) - datetime.timedelta(days=HISTORY_DETAIL_DAYS)
+    if _downsampled_before == cutoff:
+        return
+    day = {"$lt": cutoff} if _downsampled_before is None else {"$gte": _downsampled_before, "$lt": cutoff}
+    try:
+        result = await PRICE_HISTORY.update_many(
+            {"day": day, "changes": {"$exists": True}},
+            {"$unset": {"changes": ""}},
+        )
+        _downsampled_before = cutoff
+        if result.modified_count:
+            logging.info("Downsampled %s price history buckets.", result.modified_count)
+    except Exception as e:
+        logging.error("Error downsampling price history: %s", e)
+
+
+@timed(MONGO_SECONDS, errors=MONGO_ERRORS)
+async def fetch_history_summary(product_id, days=30, last_changes=5):
+    """Summarise the last `days` of a product's prices from its daily buckets.
+
+    Returns None when nothing was recorded, otherwise a dict with min, max, average
+    and the most recent changes (newest first). The average is the mean of the daily
+    averages, so a day with many changes weighs no more than a day without any.
+    """
+    since = bucket_day(datetime.datetime.now(datetime.timezone.utc)) - datetime.timedelta(days=days - 1)
+    try:
+        cursor = PRICE_HISTORY.find(
+            {"product_id": product_id, "day": {"$gte": since}},
+            {"_id": 0, "min": 1, "max": 1, "sum": 1, "count": 1, "changes": 1},
+        ).sort("day", -1)
+        buckets = await cursor.to_list(length=days)
+    except Exception as e:
+        logging.error("Error fetching price history: %s", e)
+        return None
+
+    count = sum(bucket["count"] for bucket in buckets)
+    if not count:
+        return None
+
+    recent = []
+    for bucket in buckets:
+        recent.extend(reversed(bucket.get("changes", [])))
+        if len(recent) >= last_changes:
+            break
+
+    return {
+        "days": days,
+        "min": min(bucket["min"] for bucket in buckets),
+        "max": max(bucket["max"] for bucket in buckets),
+        "average": sum(bucket["sum"] / bucket["count"] for bucket in buckets if bucket["count"])
+        / sum(1 for bucket in buckets if bucket["count"]),
+        "observations": count,
+        "recent": recent[:last_changes],
+    }
@@ -0,0 +1,53 @@
+# http_client.py
+
+import logging
+import os
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 15))  # Whole request, seconds
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", 100))  # Open connections in total
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 10))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))  # Seconds
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))  # Idle keep-alive, seconds
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+_session = None
+
+
+async def start():
+    """Open the shared HTTP session; called once when the bot starts."""
+    get_session()
+
+
+def get_session():
+    """The pooled aiohttp session shared by every outgoing request (created on first use)."""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            headers={"User-Agent": USER_AGENT},
+        )
+        logging.info("HTTP session started.")
+    return _session
+
+
+async def close():
+    """Close the shared session and its pooled connections; called on shutdown."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logging.info("HTTP session closed.")
+    _session = None
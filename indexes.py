@@ -0,0 +1,237 @@
+# indexes.py
+#
+# Every index the bot relies on, declared in one place and created at startup
+# (worker.prepare_database, notifier.py). Duplicate users and trackings are merged
+# first so the unique indexes can be built. `explain_queries` runs explain() on the
+# helper queries and flags the ones Mongo would answer with a collection scan:
+#
+#   python indexes.py           # create the indexes
+#   python indexes.py explain   # print the query plans, exit 1 on a COLLSCAN
+
+import asyncio
+import datetime
+import logging
+import sys
+import logs
+import db
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from helpers import collection, PRODUCTS, USERS, DIGESTS, alert_filter
+from history import PRICE_HISTORY
+from cache import CACHE
+from jobs import JOBS, PRICE_ALERT
+from leases import claimable_query
+
+
+def declared_indexes():
+    """(collection, [IndexModel]) for every collection; names are kept where indexes already existed."""
+    return [
+        (collection, [
+            # One tracking per user and product; also serves /my_trackings and count_tracked_products
+            IndexModel([("user_id", ASCENDING), ("product_id", ASCENDING)], unique=True),
+            # Per-tracking alert thresholds: "trackers of product X whose target is at or above the new price";
+            # its product_id prefix also serves the remaining-trackers lookup of delete_one
+            IndexModel([("product_id", ASCENDING), ("target_price", ASCENDING)]),
+        ]),
+        (USERS, [
+            IndexModel("user_id", unique=True),
+        ]),
+        (PRODUCTS, [
+            # Due-product queue of the adaptive scheduler
+            IndexModel("next_check_at"),
+            # Canonical product identity; documents without a key (unrecognised links) are left out
+            IndexModel(
+                [("platform", ASCENDING), ("product_key", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"product_key": {"$type": "string"}},
+            ),
+            # Links without a product key are matched by name (add_new_product)
+            IndexModel("product_name"),
+        ]),
+        (PRICE_HISTORY, [
+            IndexModel([("product_id", ASCENDING), ("day", DESCENDING)], unique=True),
+            IndexModel("day"),
+            IndexModel("expires_at", expireAfterSeconds=0),
+        ]),
+        (DIGESTS, [
+            # One pending entry per user and product; claimed entries each carry their flush's claim
+            IndexModel([("user_id", ASCENDING), ("product_id", ASCENDING), ("claim", ASCENDING)], unique=True),
+            # Pending entries (claim null) and the entries of one flush, oldest first
+            IndexModel([("claim", ASCENDING), ("queued_at", ASCENDING)]),
+            # Claims of a flush that died, taken over once they run out
+            IndexModel("claimed_until"),
+        ]),
+        (CACHE, [
+            IndexModel("expires_at", expireAfterSeconds=0),
+        ]),
+        (JOBS, [
+            IndexModel([("kind", ASCENDING), ("status", ASCENDING), ("available_at", ASCENDING)]),
+            IndexModel("expires_at", expireAfterSeconds=0),
+        ]),
+    ]
+
+
+# Indexes made redundant by a declared one, dropped when found
+OBSOLETE_INDEXES = [
+    (collection, "user_id_1"),  # Prefix of the unique (user_id, product_id) index
+    (collection, "product_id_1_user_id_1"),  # Only served fetch_subscribers; (product_id, target_price) covers the rest
+]
+
+
+async def _merge_duplicates(target, keys):
+    """Keep the oldest document of each group sharing `keys`, fill in fields it lacks from the others
+    and delete the rest. Returns {group key values: number of documents removed}."""
+    pipeline = [
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": {key: f"${key}" for key in keys}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    removed = {}
+    async for group in target.aggregate(pipeline, allowDiskUse=True):
+        keep, *duplicates = [document async for document in target.find({"_id": {"$in": group["ids"]}}).sort("_id", 1)]
+        missing = {}
+        for document in duplicates:
+            for field, value in document.items():
+                if field not in keep and field not in missing:
+                    missing[field] = value
+        if missing:
+            await target.update_one({"_id": keep["_id"]}, {"$set": missing})
+        await target.delete_many({"_id": {"$in": [document["_id"] for document in duplicates]}})
+        removed[tuple(group["_id"].get(key) for key in keys)] = len(duplicates)
+    return removed
+
+
+async def deduplicate():
+    """Merge the duplicate users and trackings that would block the unique indexes."""
+    users = await _merge_duplicates(USERS, ["user_id"])
+    trackings = await _merge_duplicates(collection, ["user_id", "product_id"])
+    for (_, product_id), count in trackings.items():
+        await PRODUCTS.update_one({"_id": product_id}, {"$inc": {"trackers": -count}})
+    if users or trackings:
+        logging.info(
+            "Merged %s duplicate users and %s duplicate trackings",
+            sum(users.values()), sum(trackings.values()),
+        )
+
+
+async def _drop_conflicting(target, models):
+    """Drop existing indexes on the same keys with different options (e.g. user_id_1 before it was unique)."""
+    existing = await target.index_information()
+    for model in models:
+        spec = model.document
+        for name, info in existing.items():
+            same_keys = list(info["key"]) == list(spec["key"].items())
+            options = {option: info.get(option) for option in ("unique", "expireAfterSeconds", "partialFilterExpression")}
+            wanted = {option: spec.get(option) for option in options}
+            if same_keys and name != "_id_" and options != wanted:
+                logging.warning("Replacing index %s on %s: %s -> %s", name, target.name, options, wanted)
+                await target.drop_index(name)
+
+
+async def ensure_indexes():
+    """Create every declared index (safe to call on every startup)."""
+    try:
+        await deduplicate()
+    except Exception as e:
+        logging.error("Error merging duplicates: %s", e)
+    for target, models in declared_indexes():
+        try:
+            await _drop_conflicting(target, models)
+            await target.create_indexes(models)
+        except Exception as e:
+            logging.error("Error creating %s indexes: %s", target.name, e)
+    for target, name in OBSOLETE_INDEXES:
+        try:
+            if name in await target.index_information():
+                await target.drop_index(name)
+        except Exception as e:
+            logging.error("Error dropping index %s: %s", name, e)
+    logging.info("Indexes are in place.")
+
+
+def helper_queries():
+    """(helper, collection, filter, sort) for the queries the helpers send, with sample values."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    product_id, user_id = ObjectId(), 0
+    due = {"$or": [{"next_check_at": {"$lte": now}}, {"next_check_at": None}]}
+    return [
+        ("fetch_alert_subscribers", collection, {"$or": [alert_filter(product_id, 100, 90)]}, None),
+        ("fetch_all_products", collection, {"user_id": user_id}, [("_id", 1)]),
+        ("count_tracked_products", collection, {"user_id": user_id}, None),
+        ("add_new_product (tracking)", collection, {"user_id": user_id, "product_id": product_id}, None),
+        ("delete_one (remaining trackers)", collection, {"product_id": product_id}, None),
+        ("add_new_product (by key)", PRODUCTS, {"platform": "amazon", "product_key": "B000000000"}, None),
+        ("add_new_product (by name)", PRODUCTS, {"product_name": "sample"}, None),
+        ("claim_due_products", PRODUCTS, claimable_query(due, now), [("next_check_at", 1)]),
+        ("seconds_until_next_check", PRODUCTS, {"next_check_at": {"$ne": None}}, [("next_check_at", 1)]),
+        ("fetch_digest_users", USERS, {"user_id": {"$in": [user_id]}, "alert_mode": "digest"}, None),
+        ("log_new_user", USERS, {"user_id": user_id}, None),
+        ("queue_digest_entries", DIGESTS, {"user_id": user_id, "product_id": product_id, "claim": None}, None),
+        ("claim_digest_entries", DIGESTS, {"$or": [{"claim": None}, {"claimed_until": {"$lte": now}}]}, None),
+        ("send_digests", DIGESTS, {"claim": ObjectId()}, [("queued_at", 1)]),
+        ("fetch_history_summary", PRICE_HISTORY, {"product_id": product_id, "day": {"$gte": now}}, [("day", -1)]),
+        ("jobs.claim", JOBS, {"kind": PRICE_ALERT, "status": {"$in": ["pending", "running"]},
+                              "available_at": {"$lte": now}}, None),
+    ]
+
+
+def _plan_stages(plan):
+    """Stage names and index names of a winning plan, all the way down its inputs."""
+    plan = plan.get("queryPlan", plan)  # Slot-based engine plans are wrapped
+    yield plan.get("stage"), plan.get("indexName")
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            yield from _plan_stages(child)
+
+
+async def explain_queries():
+    """Winning plan of every helper query; `collscan` is True where no index is used."""
+    results = []
+    for helper, target, query, sort in helper_queries():
+        cursor = target.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            plan = await cursor.explain()
+            stages = list(_plan_stages(plan["queryPlanner"]["winningPlan"]))
+        except Exception as e:
+            results.append({"helper": helper, "collection": target.name, "error": str(e), "collscan": False})
+            continue
+        results.append({
+            "helper": helper,
+            "collection": target.name,
+            "stages": [stage for stage, _ in stages if stage],
+            "indexes": sorted({index for _, index in stages if index}),
+            "collscan": any(stage == "COLLSCAN" for stage, _ in stages),
+        })
+    return results
+
+
+def format_plans(results):
+    lines = []
+    for result in results:
+        if "error" in result:
+            lines.append(f"❔ {result['helper']} ({result['collection']}): {result['error']}")
+            continue
+        mark = "⚠️ COLLSCAN" if result["collscan"] else "✅"
+        via = ", ".join(result["indexes"]) or " > ".join(result["stages"])
+        lines.append(f"{mark} {result['helper']} ({result['collection']}): {via}")
+    return "\n".join(lines)
+
+
+async def main(args):
+    await db.connect()
+    try:
+        if args[:1] == ["explain"]:
+            results = await explain_queries()
+            print(format_plans(results))
+            return 1 if any(result["collscan"] for result in results) else 0
+        await ensure_indexes()
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logs.setup()
+    sys.exit(asyncio.run(main(sys.argv[1:])))
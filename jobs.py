@@ -0,0 +1,102 @@
+# jobs.py
+
+import asyncio
+import datetime
+import logging
+import os
+from pymongo import ReturnDocument
+import db
+from leases import WORKER_ID
+import metrics
+
+# Work handed between the bot, scrape workers and notifier when they run as separate processes
+JOBS = db.collection(os.getenv("JOBS", "Jobs"))
+
+# Job kinds
+PRICE_ALERT = "price_alert"
+
+# Seconds a claimed job stays reserved before another process may retry it
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 300))
+# Attempts before a job is marked failed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+# Pause between polls while the queue is empty
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1))
+# Finished and failed jobs are removed by a TTL index after this many seconds
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", 86400))
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+async def enqueue(kind, payload):
+    now = _now()
+    await JOBS.insert_one({
+        "kind": kind,
+        "payload": payload,
+        "status": "pending",
+        "attempts": 0,
+        "available_at": now,
+        "created_at": now,
+    })
+
+
+async def claim(kind, worker_id=WORKER_ID):
+    """Atomically take the oldest runnable job of `kind`, including ones whose worker vanished."""
+    now = _now()
+    return await JOBS.find_one_and_update(
+        # A running job's available_at is its lease expiry
+        {"kind": kind, "status": {"$in": ["pending", "running"]}, "available_at": {"$lte": now}},
+        {
+            "$set": {
+                "status": "running",
+                "worker": worker_id,
+                "available_at": now + datetime.timedelta(seconds=JOB_LEASE_SECONDS),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("available_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def complete(job):
+    await JOBS.update_one(
+        {"_id": job["_id"]},
+        {"$set": {"status": "done", "expires_at": _now() + datetime.timedelta(seconds=JOB_RETENTION)}},
+    )
+
+
+async def retry(job, error):
+    """Put a failed job back with a growing delay, or give up after JOB_MAX_ATTEMPTS."""
+    now = _now()
+    if job["attempts"] >= JOB_MAX_ATTEMPTS:
+        update = {"status": "failed", "error": str(error), "expires_at": now + datetime.timedelta(seconds=JOB_RETENTION)}
+    else:
+        delay = datetime.timedelta(seconds=30 * 2 ** (job["attempts"] - 1))
+        update = {"status": "pending", "error": str(error), "available_at": now + delay}
+    await JOBS.update_one({"_id": job["_id"]}, {"$set": update})
+
+
+async def work(kind, handler, concurrency=1):
+    """Run `handler(payload)` for every job of `kind`, forever; polls while the queue is empty.
+
+    Delivery is at least once: a job whose process dies mid-way is retried once its
+    lease runs out.
+    """
+    async def consumer():
+        while True:
+            job = await claim(kind)
+            if job is None:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+            try:
+                await handler(job["payload"])
+                await complete(job)
+                metrics.JOBS.inc(kind=kind, outcome="done")
+            except Exception as e:
+                logging.error("Job %s (%s) failed on attempt %s: %s", job['_id'], kind, job['attempts'], e)
+                await retry(job, e)
+                metrics.JOBS.inc(kind=kind, outcome="failed" if job["attempts"] >= JOB_MAX_ATTEMPTS else "retried")
+
+    await asyncio.gather(*(consumer() for _ in range(concurrency)))
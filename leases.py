@@ -0,0 +1,76 @@
+# leases.py
+
+import asyncio
+import datetime
+import os
+import socket
+from bson import ObjectId
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Identifies this process in lease_owner; defaults to host and pid so local workers differ
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# How long a claimed product stays reserved; must cover a scrape plus one batch flush interval
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", 300))
+# Products claimed together whenever the sweep needs more work
+LEASE_BATCH_SIZE = int(os.getenv("LEASE_BATCH_SIZE", 10))
+
+# Removed again by the write that finishes the check
+RELEASE = {"lease_owner": "", "lease_expires_at": ""}
+
+
+def claimable_query(due_query, now):
+    """Due products that nobody holds an unexpired lease on."""
+    return {"$and": [due_query, {"$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lte": now}}]}]}
+
+
+def owned(product):
+    """Filter matching the product only while this worker's lease on it is still the current one.
+
+    A worker whose lease expired and was taken over writes nothing, so the product is never
+    updated (or announced) twice.
+    """
+    if "lease_token" in product:
+        return {"_id": product["_id"], "lease_token": product["lease_token"]}
+    return {"_id": product["_id"]}
+
+
+async def claim(products, due_query, worker_id=None, lease_seconds=None):
+    """Atomically lease the most overdue claimable product, or return None when there is none."""
+    worker_id = worker_id or WORKER_ID
+    lease_seconds = lease_seconds or LEASE_SECONDS
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return await products.find_one_and_update(
+        claimable_query(due_query, now),
+        {
+            "$set": {
+                "lease_owner": worker_id,
+                "lease_token": ObjectId(),
+                "lease_expires_at": now + datetime.timedelta(seconds=lease_seconds),
+            }
+        },
+        sort=[("next_check_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def claim_due_products(products, due_query, batch_size=None, worker_id=None, lease_seconds=None):
+    """Yield due products leased to this worker, claiming `batch_size` at a time until none are left.
+
+    Claims are made lazily as the sweep pulls products, so leases are only held for work
+    that is about to start. Each claim is a single find_one_and_update, so several
+    processes can run this against the same collection without scraping a product twice.
+    """
+    batch_size = batch_size or LEASE_BATCH_SIZE
+    while True:
+        batch = await asyncio.gather(
+            *(claim(products, due_query, worker_id, lease_seconds) for _ in range(batch_size))
+        )
+        claimed = [product for product in batch if product]
+        for product in claimed:
+            yield product
+        if len(claimed) < batch_size:
+            return
@@ -0,0 +1,97 @@
+# logs.py
+#
+# Logging setup shared by main.py, worker.py and notifier.py. Records are put on a
+# queue and written by a background thread, so a slow stdout or log shipper never
+# blocks the event loop; messages use %-style arguments and are only formatted by
+# that thread, and only when the level is enabled. Arguments that could change before
+# then (dicts, lists, objects) are formatted on the caller's thread instead; extra=
+# fields are not copied, so pass values that are not mutated afterwards. Per-product
+# lines go through `sampled`, sweeps log one aggregate summary instead.
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" for people, "json" for log shippers (one object per line, extra= fields included)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Share of per-product lines (scrapes, price writes) that are kept; 0 drops them all
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01))
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+# LogRecord attributes that are not extra= fields
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+# Arguments that cannot change between the call and the write
+_IMMUTABLE = (str, bytes, int, float, bool, type(None))
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_FIELDS)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Queues records as they are; QueueHandler would format them on the caller's thread first."""
+
+    def prepare(self, record):
+        args = record.args
+        if isinstance(args, dict) or (args and not all(isinstance(arg, _IMMUTABLE) for arg in args)):
+            # Snapshot mutable arguments now, or the writer thread could render later values
+            record.msg, record.args = record.getMessage(), None
+        return record
+
+
+def setup(level=None, fmt=None):
+    """Route the root logger through a queue to a stream handler on a background thread."""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == "json" else logging.Formatter(TEXT_FORMAT))
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(LazyQueueHandler(records))
+    root.setLevel(level or LOG_LEVEL)
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Write out queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def sampled(level, msg, *args, rate=None, **kwargs):
+    """Log a per-item line for a `rate` share of calls; skipped cheaply when the level is off."""
+    rate = LOG_SAMPLE_RATE if rate is None else rate
+    logger = logging.getLogger()
+    if rate <= 0 or not logger.isEnabledFor(level) or random.random() >= rate:
+        return
+    extra = {**kwargs.pop("extra", {}), "sample_rate": rate}
+    logger.log(level, msg, *args, extra=extra, **kwargs)
@@ -2,30 +2,40 @@
 
 
 
-from pyrogram import Client, filters  # Pyrogram is an async Telegram API wrapper. Ensure it is installed (`pip install pyrogram`).
+from pyrogram import Client, filters, idle  # Pyrogram is an async Telegram API wrapper. Ensure it is installed (`pip install pyrogram`).
 from pyrogram.types import Message, InputMediaPhoto
 from dotenv import load_dotenv  # Used for environment variable management (`pip install python-dotenv`).
 import os
-import re
+import math
 import asyncio
 import schedule  # Used for task scheduling. Ensure it's installed (`pip install schedule`).
 import pytz  # For timezone management. Install if needed (`pip install pytz`).
-from pymongo import MongoClient  # MongoDB client library (`pip install pymongo`).
 import datetime
 import time
 import threading
-import requests  # For making HTTP requests (`pip install requests`).
+import aiohttp  # Async HTTP client used through http_client (`pip install aiohttp`).
 import json
 from bson import ObjectId  # Used to work with MongoDB object IDs. Comes with pymongo.
 import logging
+import logs
 
 # Import functions from your other files
 from scraper import scrape
-from scheduler import check_prices
-from helpers import fetch_all_products, add_new_product, fetch_one_product, delete_one, update_product_price, fetch_global_product
-from regex_patterns import flipkart_patterns, amazon_patterns, all_url_patterns  # Ensure this file exists and patterns are correctly defined.
+from alerts import notify_users, send_digests_forever, DIGEST_INTERVAL
+import events
+from history import fetch_history_summary
+from cache import expanded_urls, affiliate_links, scrape_results, cache_stats
+from indexes import explain_queries, format_plans
+from urlnorm import product_key
+import executor
+import metrics
+from metrics import timed, HANDLER_SECONDS
+import http_client
+import db
+from dispatcher import get_dispatcher, stop_dispatchers
+from helpers import USERS, fetch_all_products, count_tracked_products, TRACKINGS_PAGE_SIZE, add_new_product, fetch_one_product, delete_one, update_product_price, fetch_global_product, set_alert_mode, update_alert_settings
+from regex_patterns import find_product_urls, classify_url  # Host table of the supported Amazon/Flipkart links.
 from tenacity import retry, stop_after_attempt, wait_exponential
-from motor.motor_asyncio import AsyncIOMotorClient  # For async MongoDB operations (`pip install motor`).
 
 
 # Load environment variables
@@ -44,15 +54,14 @@ api_hash = os.getenv("API_HASH")
 
 EARNKARO_API_TOKEN = os.getenv("EARNKARO_API_TOKEN")
 
+# Leave price checks and alerts to worker.py and notifier.py
+SPLIT_PROCESSES = os.getenv("SPLIT_PROCESSES", "false").lower() in ("1", "true", "yes")
 
 
-# MongoDB connection
 
-dbclient = AsyncIOMotorClient(os.getenv("MONGO_URI"))
+# MongoDB collections, on the client shared by every module (db.py)
 
-database = dbclient[os.getenv("DATABASE")]
-
-users_collection = database["Users"]
+users_collection = USERS
 
 
 
@@ -64,7 +73,7 @@ ADMINS = [1720819569] # Replace with actual admin user ID(s)
 
 # Set up logging
 
-logging.basicConfig(level=logging.INFO)
+logs.setup()  # Queued, non-blocking log output; see logs.py
 
 
 
@@ -78,13 +87,11 @@ async def log_new_user(user_id, username):
     }
     
     try:
-        existing_user = await users_collection.find_one({"user_id": user_id})
-        if not existing_user:
-            await users_collection.insert_one(user)
-            return True
-        return False
+        # Insert only if missing, atomically; the unique user_id index rules out duplicates
+        result = await users_collection.update_one({"user_id": user_id}, {"$setOnInsert": user}, upsert=True)
+        return result.upserted_id is not None
     except Exception as e:
-        logging.error(f"MongoDB Error: {e}")
+        logging.error("MongoDB Error: %s", e)
         return False
 
 
@@ -98,17 +105,17 @@ app = Client("PriceTrackerBot", api_id=api_id, api_hash=api_hash, bot_token=bot_
 
 # Function to expand short URLs
 
-def expand_short_url(short_url):
+async def expand_short_url(short_url):
 
   try:
 
-    response = requests.head(short_url, allow_redirects=True)
+    async with http_client.get_session().head(short_url, allow_redirects=True) as response:
 
-    return response.url
+      return str(response.url)
 
   except Exception as e:
 
-    logging.error(f"Error expanding URL: {e}")
+    logging.error("Error expanding URL: %s", e)
 
     return None
 
@@ -128,37 +135,50 @@ async def convert_to_affiliate_link(url):
     }
 
     try:
-        logging.info(f"Converting URL: {url}")
-        response = requests.post(api_url, headers=headers, data=payload)
-
-        # Check if request succeeded and return the affiliate link
-        response_data = response.json()
-        if response.status_code == 200 and response_data.get("success") == 1:
-            return response_data.get("data")
-        else:
-            logging.error(f"Conversion failed: {response_data.get('message')}")
-            return None
+        logging.info("Converting URL: %s", url)
+        async with http_client.get_session().post(api_url, headers=headers, data=payload) as response:
+            # Check if request succeeded and return the affiliate link
+            response_data = await response.json(content_type=None)
+            if response.status == 200 and response_data.get("success") == 1:
+                return response_data.get("data")
+            else:
+                logging.error("Conversion failed: %s", response_data.get('message'))
+                return None
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Network error during conversion: {e}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error("Network error during conversion: %s", e)
         raise  # Reraise the error to trigger retry mechanism
 
     except Exception as e:
-        logging.error(f"Unexpected error during conversion: {e}")
+        logging.error("Unexpected error during conversion: %s", e)
         raise  # Reraise the error to trigger retry mechanism
 
 
 
 
-# Function to extract URLs from text
+# Function to extract supported product URLs from text
 
 def extract_urls(text):
 
-  return re.findall(r'https?://\S+', text)
+  return find_product_urls(text)
+
+
+
+# Message filter for supported product links; the classified links are kept on the message for the handler
+
+def has_product_links(_, __, message):
+
+  message.product_urls = find_product_urls(message.text or message.caption)
+
+  return bool(message.product_urls)
+
+
+product_links = filters.create(has_product_links)
 
 
 
 @app.on_message(filters.command("start") & filters.private)
+@timed(HANDLER_SECONDS, command="start")
 async def start(_, message: Message):
     user_id = message.from_user.id
     username = message.from_user.username
@@ -179,13 +199,16 @@ async def start(_, message: Message):
 
 
 @app.on_message(filters.command("help") & filters.private)
+@timed(HANDLER_SECONDS, command="help")
 async def help(_, message: Message):
     text = (
         "Here are the commands you can use with PriceTrackerBot:\n\n"
         "/start - Start the bot.\n"
-        "/my_trackings - List tracked products.\n"
+        "/my_trackings [page] - List tracked products.\n"
         "/product [ID] - Get details on a product.\n"
         "/stop [ID] - Stop tracking a product.\n"
+        "/alert [ID] target|drop|drops|reset - Only alert below a target price, on big drops or on drops only.\n"
+        "/digest on|off - A periodic summary of price changes instead of an alert per product.\n"
         "/broadcast - Admin only.\n"
         "/help - Show this message.\n"
     )
@@ -194,49 +217,123 @@ async def help(_, message: Message):
 
 
 
+@app.on_message(filters.command("digest") & filters.private)
+@timed(HANDLER_SECONDS, command="digest")
+async def digest(_, message: Message):
+    choice = message.command[1].lower() if len(message.command) > 1 else ""
+    if choice not in ("on", "off"):
+        await message.reply_text("Usage: /digest on|off")
+        return
+    mode = "digest" if choice == "on" else "instant"
+    if await set_alert_mode(message.chat.id, mode):
+        if mode == "digest":
+            await message.reply_text(
+                f"Digest mode on: you'll get one summary of all price changes every {DIGEST_INTERVAL / 60:g} minutes."
+            )
+        else:
+            await message.reply_text("Digest mode off: you'll get an alert for every price change.")
+    else:
+        await message.reply_text("Couldn't update your alert settings, please try again later.")
+
+
+
+
+@app.on_message(filters.command("cache_stats") & filters.user(ADMINS))
+@timed(HANDLER_SECONDS, command="cache_stats")
+async def show_cache_stats(_, message: Message):
+    lines = ["Cache hit rates:\n"]
+    for stats in cache_stats():
+        lines.append(
+            f"• {stats['name']}: {stats['hit_rate']:.0%} "
+            f"(memory {stats['memory_hits']}, mongo {stats['mongo_hits']}, misses {stats['misses']}, "
+            f"{stats['entries']} cached)"
+        )
+    await message.reply_text("\n".join(lines))
+
+
+
+
+@app.on_message(filters.command("query_plans") & filters.user(ADMINS))
+@timed(HANDLER_SECONDS, command="query_plans")
+async def show_query_plans(_, message: Message):
+    results = await explain_queries()
+    collscans = sum(result["collscan"] for result in results)
+    header = f"Query plans ({collscans} collection scans):\n\n" if collscans else "Query plans (all indexed):\n\n"
+    await message.reply_text(header + format_plans(results))
+
+
+
+
+@app.on_message(filters.command("broadcast") & filters.user(ADMINS) & filters.reply)
+@timed(HANDLER_SECONDS, command="broadcast")
 async def broadcast(bot, message):
-    users = await users_collection.find().to_list(length=None)
+    users = await users_collection.find({}, {"user_id": 1}).to_list(length=None)
     b_msg = message.reply_to_message
-    
-    total_users = len(users)
-    success, failed = 0, 0
 
-    for user in users:
-        try:
-            await bot.send_message(user["user_id"], b_msg.text.markdown)
-            success += 1
-        except Exception as e:
-            logging.error(f"Failed to send message to {user['user_id']}: {e}")
-            failed += 1
-        await asyncio.sleep(1)  # Rate limiting to avoid bot API limit
+    total_users = len(users)
+    # The shared dispatcher sends as fast as Telegram allows and retries on FloodWait
+    success, failed = await get_dispatcher(bot).send_many(
+        [user["user_id"] for user in users], b_msg.text.markdown, tag="broadcast", priority=1
+    )
 
-    await message.reply_text(f"Broadcast completed:\nSuccess: {success}\nFailed: {failed}")
+    await message.reply_text(f"Broadcast completed:\nTotal: {total_users}\nSuccess: {success}\nFailed: {failed}")
 
 
 @app.on_message(filters.command("my_trackings") & filters.private)
+@timed(HANDLER_SECONDS, command="my_trackings")
 async def track(_, message):
     try:
         chat_id = message.chat.id
+
+        # Optional page number: /my_trackings 2
+        page = 1
+        if len(message.command) > 1 and message.command[1].isdigit():
+            page = max(1, int(message.command[1]))
+
         text = await message.reply_text("Fetching Your Products...")
-        products = await fetch_all_products(chat_id)  # This queries MongoDB for tracked products.
+        total = await count_tracked_products(chat_id)
+        total_pages = max(1, -(-total // TRACKINGS_PAGE_SIZE))
+        page = min(page, total_pages)
+        offset = (page - 1) * TRACKINGS_PAGE_SIZE
+        products = await fetch_all_products(chat_id, skip=offset, limit=TRACKINGS_PAGE_SIZE)  # One aggregation per page.
 
         if products:
-            products_message = "Your Tracked Products:\n\n"
-            for i, product in enumerate(products, start=1):
+            products_message = f"Your Tracked Products (page {page}/{total_pages}):\n\n"
+            for i, product in enumerate(products, start=offset + 1):
                 _id = product.get("product_id")
                 product_name = product.get("product_name")
                 affiliate_url = product.get("affiliate_url", "#")  # Ensure affiliate links are correctly handled.
                 product_price = product.get("price")
                 products_message += f"🏷️ **Product {i}**: [{product_name}]({affiliate_url})\n💰 **Current Price**: ₹{product_price}\n❌ Use /stop_{_id} to Stop tracking\n\n"
+            if page < total_pages:
+                products_message += f"➡️ Use /my_trackings {page + 1} for the next page"
             await text.edit(products_message, disable_web_page_preview=True)
         else:
             await text.edit("No products added yet")
     except Exception as e:
-        logging.error(f"Error fetching products: {e}")
+        logging.error("Error fetching products: %s", e)
+
+
 
+# Messages waiting to be deleted; the references keep the tasks alive until they finish
+pending_deletes = set()
+
+async def delete_later(message, delay):
+    await asyncio.sleep(delay)
+    try:
+        await message.delete()
+    except Exception as e:
+        logging.error("Error deleting message: %s", e)
 
+def schedule_delete(message, delay=5):
+    # Runs after the handler returns, so the delay is not counted in its latency
+    task = asyncio.create_task(delete_later(message, delay))
+    pending_deletes.add(task)
+    task.add_done_callback(pending_deletes.discard)
 
-@app.on_message(filters.regex("|".join(all_url_patterns)) | filters.photo | filters.document)
+
+@app.on_message(product_links | filters.photo | filters.document)
+@timed(HANDLER_SECONDS, command="track_link")
 async def track_product_url(_, message: Message):
     try:
         # Ensure the user sends only links, not images or documents
@@ -244,8 +341,8 @@ async def track_product_url(_, message: Message):
             await message.reply_text("Please send only links, not images or documents.")
             return
 
-        # Extract URLs from the message
-        urls = extract_urls(message.text)
+        # Extract URLs from the message (already classified by the product_links filter)
+        urls = getattr(message, "product_urls", None) or extract_urls(message.text)
         if not urls:
             await message.reply_text("Please send a valid URL.")
             return
@@ -254,20 +351,35 @@ async def track_product_url(_, message: Message):
         status = await message.reply_text("Analyzing Your Product... Please Wait!!")
 
         # Loop through each URL
-        for url in urls:
-            expanded_url = expand_short_url(url) or url
+        for link in urls:
+            url = link.url
+
+            # Only short links (amzn.to, fkrt.cc, ...) need a round trip to resolve
+            if link.is_short:
+                expanded_url = await expanded_urls.get_or_load(url, lambda: expand_short_url(url)) or url
+            else:
+                expanded_url = url
+
+            # Determine platform (Amazon or Flipkart) from the host table
+            platform = (classify_url(expanded_url) or link).platform
 
-            # Determine platform (Amazon or Flipkart) based on patterns
-            platform = "amazon" if any(re.match(pattern, expanded_url) for pattern in amazon_patterns) else "flipkart"
+            # Same product shared by many users -> one conversion and one scrape (see cache.py)
+            key = product_key(expanded_url)
+            cache_key = ":".join(key) if key else None
 
             # Convert to affiliate link using EarnKaro
-            affiliate_link = await convert_to_affiliate_link(expanded_url)
+            affiliate_link = await affiliate_links.get_or_load(cache_key, lambda: convert_to_affiliate_link(expanded_url))
             if not affiliate_link:
                 await message.reply_text("Failed to convert link to affiliate link.")
                 continue
 
             # Scrape product details (name, price, availability)
-            product_name, price, availability, image_url = await scrape(affiliate_link, platform)
+            async def scrape_product():
+                result = await scrape(affiliate_link, platform)
+                return list(result) if result[0] else None  # Only cache successful scrapes
+
+            scraped = await scrape_results.get_or_load(cache_key, scrape_product)
+            product_name, price, availability, image_url = scraped or (None, None, None, None)
 
             if product_name:
                 # Add the new product to the database (check for duplicates by name)
@@ -296,24 +408,24 @@ async def track_product_url(_, message: Message):
                     try:
                         await status.reply_photo(image_url)
                     except Exception as img_error:
-                        logging.error(f"Error sending image: {img_error}")
+                        logging.error("Error sending image: %s", img_error)
                         await status.reply_text("Failed to send image.")
                 await status.edit_text(product_info, disable_web_page_preview=True)
             else:
                 await status.edit("Failed to retrieve product details.")
     except Exception as e:
-        logging.error(f"Error tracking product URL: {e}")
+        logging.error("Error tracking product URL: %s", e)
         await status.edit("An error occurred while processing your request.")
 
     finally:
-        # Delete user's message after processing
-        await asyncio.sleep(5)
-        await message.delete()
+        # Delete user's message a few seconds after processing
+        schedule_delete(message)
 
 
 
 
 @app.on_message(filters.regex(r"^/product_\w+$") & filters.private)
+@timed(HANDLER_SECONDS, command="product")
 async def track_product(_, message):
     try:
         # Extract the product tracking ID from the command
@@ -323,21 +435,19 @@ async def track_product(_, message):
             return
         
         tracking_id = command_parts[1]
-        logging.info(f"Fetching product for tracking ID: {tracking_id}")
+        logging.debug("Fetching product for tracking ID: %s", tracking_id)
         
         status = await message.reply_text("Getting Product Info....")
 
         # Fetch the product from the user's PriceTracker collection using the tracking ID
         user_product = await fetch_one_product(tracking_id)
-        logging.info(f"Fetched user product: {user_product}")
 
         if user_product:
             product_id = user_product.get("product_id")
-            logging.info(f"Fetching global product for product ID: {product_id}")
+            logging.debug("Fetching global product for product ID: %s", product_id)
 
             # Fetch product details from PriceTrackerGlobal using product_id
             global_product = await fetch_global_product(product_id)
-            logging.info(f"Fetched global product: {global_product}")
 
             if global_product:
                 # Use affiliate_url instead of the original URL
@@ -347,12 +457,36 @@ async def track_product(_, message):
                 maximum_price = global_product.get("upper")
                 minimum_price = global_product.get("lower")
 
+                # Price trend from the daily history buckets
+                history = await fetch_history_summary(global_product["_id"])
+                history_message = ""
+                if history:
+                    history_message = (
+                        f"\n📊 **Last {history['days']} Days:** "
+                        f"Low ₹{history['min']} · High ₹{history['max']} · Avg ₹{history['average']:.0f}\n"
+                    )
+                    for change in history["recent"]:
+                        history_message += f"   - {change['at'].strftime('%d %b, %H:%M')}: ₹{change['price']}\n"
+
+                # This tracking's alert thresholds
+                alert_settings = []
+                if user_product.get("target_price") is not None:
+                    alert_settings.append(f"at or below ₹{user_product['target_price']:g}")
+                if user_product.get("min_drop_pct") is not None:
+                    alert_settings.append(f"drops of {user_product['min_drop_pct']:g}% or more")
+                if user_product.get("drops_only"):
+                    alert_settings.append("drops only")
+                alerts_message = ", ".join(alert_settings) or "every price change"
+
                 # Format the message
                 products_message = (
                     f"🛍 **Product:** [{product_name}]({affiliate_url})\n\n"
                     f"💲 **Current Price:** ₹{product_price}\n"
                     f"📉 **Lowest Price:** ₹{minimum_price}\n"
                     f"📈 **Highest Price:** ₹{maximum_price}\n"
+                    f"{history_message}"
+                    f"\n🔔 **Alerts:** {alerts_message}\n"
+                    f"Change with /alert_{tracking_id} target 999 | drop 10 | drops on | reset"
                     f"\n\n\nTo Stop Tracking, use /stop_{tracking_id}"
                 )
 
@@ -362,13 +496,64 @@ async def track_product(_, message):
         else:
             await status.edit("Product Not Found in your tracking list.")
     except Exception as e:
-        logging.error(f"Error retrieving product: {str(e)}")
+        logging.error("Error retrieving product: %s", e)
         await status.edit("Failed to retrieve product details.")
 
 
 
 
+def parse_threshold(value, low, high=math.inf):
+    """A finite number within [low, high] (float() alone accepts nan, inf and negatives)."""
+    number = float(value)
+    if not math.isfinite(number) or not low <= number <= high:
+        raise ValueError(f"{value} is out of range")
+    return number
+
+
+@app.on_message(filters.regex(r"^/alert_\w+") & filters.private)
+@timed(HANDLER_SECONDS, command="alert")
+async def alert_settings(_, message: Message):
+    usage = (
+        "Usage: /alert_<ID> followed by one of:\n"
+        "target <price> - Only alert at or below this price (above 0).\n"
+        "drop <percent> - Only alert on drops of at least this percentage (0-100).\n"
+        "drops on|off - Only alert when the price goes down.\n"
+        "reset - Alert on every price change again."
+    )
+    args = message.text.split()
+    tracking_id = args[0].split("_", 1)[1]
+    option = args[1].lower() if len(args) > 1 else ""
+    value = args[2].replace(",", "").lstrip("₹") if len(args) > 2 else ""
+
+    try:
+        if option == "target":
+            target = parse_threshold(value, 0)
+            if target == 0:
+                raise ValueError("a target of 0 never matches")
+            settings = {"target_price": target}
+        elif option == "drop":
+            settings = {"min_drop_pct": parse_threshold(value.rstrip("%"), 0, 100)}
+        elif option == "drops" and value.lower() in ("on", "off"):
+            settings = {"drops_only": True if value.lower() == "on" else None}
+        elif option == "reset":
+            settings = {"target_price": None, "min_drop_pct": None, "drops_only": None}
+        else:
+            await message.reply_text(usage)
+            return
+    except ValueError:
+        await message.reply_text(usage)
+        return
+
+    if await update_alert_settings(tracking_id, message.chat.id, settings):
+        await message.reply_text(f"Alert settings updated. Use /product_{tracking_id} to review them.")
+    else:
+        await message.reply_text("Product Not Found in your tracking list.")
+
+
+
+
 @app.on_message(filters.regex(r"^/stop_\w+$") & filters.private)
+@timed(HANDLER_SECONDS, command="stop")
 async def delete_product(_, message: Message):
     try:
         # Extract the product tracking ID from the command
@@ -390,21 +575,39 @@ async def delete_product(_, message: Message):
         else:
             await status.edit("Failed to Delete the product from your tracking list.")
     except Exception as e:
-        logging.error(f"Error deleting product: {str(e)}")
+        logging.error("Error deleting product: %s", e)
         await status.edit("Failed to delete the product.")
 
-async def scheduled_check_prices():
-    while True:
-        await check_prices(app)  # Call `check_prices` periodically.
-        await asyncio.sleep(600)  # Check prices every 10 minutes.
+async def send_price_alerts(changed_products):
+    await notify_users(changed_products, app)  # Instant alerts (and queued digest entries) per written batch.
+
+async def run():
+    await db.connect()  # Shared Mongo client; fails fast if the database is unreachable.
+    await app.start()  # Connect the Telegram bot.
+    await http_client.start()  # Shared HTTP connection pool.
+    metrics.serve()  # /metrics, when METRICS_PORT is set.
+    background = []
+    if not SPLIT_PROCESSES:  # Otherwise worker.py and notifier.py check prices and send alerts.
+        import worker  # Only the single-process bot loads the sweep stack.
+        events.subscribe(events.PRICE_CHANGED, send_price_alerts)
+        background.append(asyncio.create_task(worker.sweep_forever()))
+        background.append(asyncio.create_task(send_digests_forever(app)))  # Every DIGEST_INTERVAL.
+    logging.info("Bot Running")
+    try:
+        await idle()  # Wait for Ctrl+C / SIGTERM.
+    finally:
+        for task in background:
+            task.cancel()
+        await stop_dispatchers()
+        await http_client.close()
+        executor.shutdown()  # Stop the scrape pool.
+        await app.stop()
+        db.close()  # Close the pooled Mongo connections.
 
 
 
 def main():
-    loop = asyncio.get_event_loop()  # Async event loop for scheduling tasks.
-    loop.create_task(scheduled_check_prices())
-    app.run()  # Runs the Telegram bot.
-    print("Bot Running")
+    app.run(run())  # Runs the Telegram bot until it is stopped.
 
 
 
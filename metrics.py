@@ -0,0 +1,243 @@
+# metrics.py
+#
+# Counters, gauges and histograms rendered in the Prometheus text format by the
+# /metrics route in app.py. Updates are plain attribute arithmetic, cheap enough
+# for the hot paths; `timed` wraps functions and `Histogram.time` wraps blocks.
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Port of the /metrics endpoint; unset keeps it off. Give each process its own port.
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# Seconds; covers Mongo round trips up to slow scrapes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_lock = threading.Lock()  # Children are created on the event loop and read by the HTTP thread
+_metrics = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        with _lock:
+            _metrics.append(self)
+
+    def labels(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with _lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self):
+        with _lock:
+            children = list(self._children.items())
+        for key, child in children:
+            yield from child.samples(self.name, self.labelnames, key)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labelnames, key):
+        yield f"{name}{_label_text(labelnames, key)} {self.value:g}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1, **labels):
+        self.labels(**labels).inc(amount)
+
+
+class Gauge(_Metric):
+    """A value that is set, or read from `callback()` (returning {label values tuple: value}) when rendered."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value, **labels):
+        self.labels(**labels).set(value)
+
+    def _samples(self):
+        if self.callback is None:
+            yield from super()._samples()
+            return
+        try:
+            values = self.callback()
+        except Exception:
+            return
+        for key, value in values.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield f"{self.name}{_label_text(self.labelnames, key if self.labelnames else ())} {value:g}"
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def samples(self, name, labelnames, key):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{name}_bucket{_label_text(labelnames + ('le',), key + (f'{bound:g}',))} {cumulative}"
+        yield f"{name}_bucket{_label_text(labelnames + ('le',), key + ('+Inf',))} {self.count}"
+        yield f"{name}_sum{_label_text(labelnames, key)} {self.sum:g}"
+        yield f"{name}_count{_label_text(labelnames, key)} {self.count}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value, **labels):
+        self.labels(**labels).observe(value)
+
+    def time(self, **labels):
+        return _Timer(self.labels(**labels))
+
+
+class _Timer:
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+def timed(histogram, errors=None, **labels):
+    """Decorator recording a function's duration in `histogram` (and failures in `errors`).
+
+    Labels that are not given default to the function's name, e.g.
+    `@timed(MONGO_SECONDS)` labels each helper by its own name.
+    """
+    def decorator(func):
+        values = {name: labels.get(name, func.__name__) for name in histogram.labelnames}
+        child = histogram.labels(**values)
+        error_child = errors.labels(**values) if errors is not None else None
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException:
+                    if error_child is not None:
+                        error_child.inc()
+                    raise
+                finally:
+                    child.observe(time.perf_counter() - started)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except BaseException:
+                    if error_child is not None:
+                        error_child.inc()
+                    raise
+                finally:
+                    child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    with _lock:
+        metrics = list(_metrics)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+def serve(port=None):
+    """Serve /metrics from app.py's Flask app on a background thread when a port is configured."""
+    port = port or METRICS_PORT
+    if not port:
+        return
+    from app import serve_in_background  # Flask is only loaded when metrics are served
+    serve_in_background(int(port))
+    logging.info("Serving metrics on port %s", port)
+
+
+# Shared metrics of the bot, the scrape workers and the notifier
+SCRAPE_SECONDS = Histogram("pricetracker_scrape_seconds", "Time to check one product page", ("platform", "result"))
+SWEEP_SECONDS = Histogram("pricetracker_sweep_seconds", "Duration of a price check sweep")
+SWEEP_PRODUCTS = Counter("pricetracker_sweep_products_total", "Products checked by sweeps", ("platform", "outcome"))
+PRICE_CHANGES = Counter("pricetracker_price_changes_total", "Price changes written by sweeps")
+MONGO_SECONDS = Histogram("pricetracker_mongo_helper_seconds", "Latency of database helpers", ("helper",))
+MONGO_ERRORS = Counter("pricetracker_mongo_helper_errors_total", "Database helpers that raised", ("helper",))
+HANDLER_SECONDS = Histogram("pricetracker_handler_seconds", "Latency of bot command handlers", ("command",))
+MESSAGES = Counter("pricetracker_messages_total", "Outgoing Telegram messages", ("tag", "outcome"))
+FLOOD_WAITS = Counter("pricetracker_flood_wait_seconds_total", "Seconds paused by Telegram FloodWait")
+JOBS = Counter("pricetracker_jobs_total", "Queue jobs handled", ("kind", "outcome"))
+SWEEP_BACKLOG = Gauge("pricetracker_due_products", "Products due for a check when the last sweep started")
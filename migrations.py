@@ -0,0 +1,76 @@
+# migrations.py
+
+import asyncio
+import logging
+import logs
+from helpers import collection, PRODUCTS
+from scraper import parse_price
+from urlnorm import product_key
+from prices import is_available
+
+
+PRICE_FIELDS = ("price", "previous_price", "upper", "lower")
+
+
+async def merge_products(duplicate, keep):
+    """Move every tracking of `duplicate` onto `keep`, fold its price range in and delete it."""
+    async for tracking in collection.find({"product_id": duplicate["_id"]}):
+        already_tracking = await collection.find_one({"user_id": tracking["user_id"], "product_id": keep["_id"]})
+        if already_tracking:
+            await collection.delete_one({"_id": tracking["_id"]})
+        else:
+            await collection.update_one({"_id": tracking["_id"]}, {"$set": {"product_id": keep["_id"]}})
+
+    trackers = await collection.count_documents({"product_id": keep["_id"]})
+    update = {"$set": {"trackers": trackers}}
+    upper, lower = parse_price(duplicate.get("upper")), parse_price(duplicate.get("lower"))
+    if is_available(upper):
+        update["$max"] = {"upper": upper}
+    if is_available(lower):
+        update["$min"] = {"lower": lower}
+    await PRODUCTS.update_one({"_id": keep["_id"]}, update)
+    await PRODUCTS.delete_one({"_id": duplicate["_id"]})
+
+
+async def migrate_product_keys():
+    """Backfill platform/product_key on older global products and merge the duplicates it reveals.
+
+    Also converts prices stored as strings into numbers. Only documents without a
+    product_key field are visited; links without a recognisable key get product_key
+    None, so every product is migrated once and later startups find nothing to do.
+    """
+    migrated = merged = skipped = 0
+    async for product in PRODUCTS.find({"product_key": {"$exists": False}}):
+        identity = product_key(product.get("url"))
+        if identity:
+            platform, key = identity
+            existing = await PRODUCTS.find_one({"platform": platform, "product_key": key})
+            if existing:
+                await merge_products(product, existing)
+                merged += 1
+                continue
+            update = {"platform": platform, "product_key": key}
+            migrated += 1
+        else:
+            update = {"product_key": None}  # Left out of the unique index, which only covers string keys
+            skipped += 1
+
+        for field in PRICE_FIELDS:
+            if isinstance(product.get(field), str):
+                update[field] = parse_price(product[field])
+        if "trackers" not in product:
+            update["trackers"] = await collection.count_documents({"product_id": product["_id"]})
+        await PRODUCTS.update_one({"_id": product["_id"]}, {"$set": update})
+
+    if migrated or merged or skipped:
+        logging.info(
+            "Product key migration: %s updated, %s merged into existing products, "
+            "%s without a recognisable product URL",
+            migrated, merged, skipped,
+        )
+    return migrated, merged, skipped
+
+
+if __name__ == "__main__":
+    logs.setup()
+    asyncio.run(migrate_product_keys())
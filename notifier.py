@@ -0,0 +1,59 @@
+# notifier.py
+#
+# Notifier for the split deployment (see README): sends the price alerts queued by
+# worker.py and, every DIGEST_INTERVAL, the digests of digest-mode users. It signs in with the bot token but does not receive updates, so it runs
+# next to main.py without taking commands away from it.
+
+import asyncio
+import logs
+import os
+from dotenv import load_dotenv
+from pyrogram import Client
+import db
+import jobs
+import metrics
+from alerts import notify_users, send_digests_forever
+from indexes import ensure_indexes
+from dispatcher import stop_dispatchers
+
+load_dotenv()
+
+# Alert jobs handled at once; sends still share one rate-limited dispatcher
+NOTIFIER_CONCURRENCY = int(os.getenv("NOTIFIER_CONCURRENCY", 4))
+
+
+async def run():
+    client = Client(
+        "PriceTrackerNotifier",
+        api_id=os.getenv("API_ID"),
+        api_hash=os.getenv("API_HASH"),
+        bot_token=os.getenv("BOT_TOKEN"),
+        no_updates=True,
+    )
+
+    async def send_price_alerts(payload):
+        if payload.get("digest"):
+            return  # Queued by an older worker; digest entries are now queued with the instant alerts
+        await notify_users(payload["product_ids"], client)
+
+    await db.connect()
+    await client.start()
+    await ensure_indexes()
+    metrics.serve()  # /metrics, when METRICS_PORT is set.
+    digests = asyncio.create_task(send_digests_forever(client))  # Every DIGEST_INTERVAL.
+    try:
+        await jobs.work(jobs.PRICE_ALERT, send_price_alerts, concurrency=NOTIFIER_CONCURRENCY)
+    finally:
+        digests.cancel()
+        await stop_dispatchers()
+        await client.stop()
+        db.close()
+
+
+def main():
+    logs.setup()
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+# prices.py
+
+# Scrapers store 0 as the price of an out-of-stock product. It marks the product as
+# unavailable and is not a price: it is never a drop, a new low, a history point or a
+# match for a target price.
+UNAVAILABLE = 0
+
+
+def is_available(price):
+    """True for a real price, False for the out-of-stock marker (or anything that is not a number)."""
+    return isinstance(price, (int, float)) and price > UNAVAILABLE
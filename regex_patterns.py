@@ -1,57 +1,58 @@
 # regex_patterns.py
 
-flipkart_patterns = [
-
-    r'https?://www\.flipkart\.com/.+',
-
-    r'https?://flipkart\.com/.+',
-
-    r'https?://m\.flipkart\.com/.+',
-
-    r'https?://dl\.flipkart\.com/.+',
-
-    r'https?://flipkart\.in/.+',
-
-    r'https?://www\.flipkart\.in/.+',
-
-    r'https?://dl\.flipkart\.in/.+',
-
-    r'https?://m\.flipkart\.in/.+',
-
-    r'https?://fkrt\.cc/.+',
-
-    r'https?://fkrt\.co/.+',
-
-    r'https?://fkrt\.it/.+',
-    
-    r'https?://fktr\.it/.+',
-
-]
-
-
-
-amazon_patterns = [
-
-    r'https://www\.amazon\.com/.*',
-
-    r'https://amazon\.com/.*',
-
-    r'https://www\.amazon\.in/.*',
-
-    r'https://amazon\.in/.*',
-
-    r'https://amzn\.in/.*',
-
-    r'https://amzn\.to/.*',
-
-    r'https://amzn\.in/.+',
-
-]
-
-
-
-
-
-all_url_patterns = amazon_patterns + flipkart_patterns
-
-
+import re
+from collections import namedtuple
+
+
+# Supported hosts: host -> (platform, is_short_link)
+HOSTS = {
+    # Amazon
+    "www.amazon.in": ("amazon", False),
+    "amazon.in": ("amazon", False),
+    "www.amazon.com": ("amazon", False),
+    "amazon.com": ("amazon", False),
+    "amzn.in": ("amazon", True),
+    "amzn.to": ("amazon", True),
+
+    # Flipkart
+    "www.flipkart.com": ("flipkart", False),
+    "flipkart.com": ("flipkart", False),
+    "m.flipkart.com": ("flipkart", False),
+    "dl.flipkart.com": ("flipkart", False),
+    "www.flipkart.in": ("flipkart", False),
+    "flipkart.in": ("flipkart", False),
+    "m.flipkart.in": ("flipkart", False),
+    "dl.flipkart.in": ("flipkart", False),
+    "fkrt.cc": ("flipkart", True),
+    "fkrt.co": ("flipkart", True),
+    "fkrt.it": ("flipkart", True),
+    "fktr.it": ("flipkart", True),
+}
+
+# Every http(s) URL in a message, with its host captured, found in a single scan
+URL_PATTERN = re.compile(r"https?://([^\s/?#:]+)(?::\d+)?([/?#]\S*)?", re.IGNORECASE)
+
+UrlMatch = namedtuple("UrlMatch", ["url", "platform", "domain", "is_short"])
+
+
+def _classify(match):
+    domain = match.group(1).lower()
+    host = HOSTS.get(domain)
+    # A product link always has a path after the host
+    if host is None or len(match.group(2) or "") < 2:
+        return None
+    platform, is_short = host
+    return UrlMatch(match.group(0), platform, domain, is_short)
+
+
+def classify_url(url):
+    """Platform, domain and short-link status of a supported product URL, or None."""
+    match = URL_PATTERN.match(url or "")
+    return _classify(match) if match else None
+
+
+def find_product_urls(text):
+    """Every supported product URL in a message, classified, in order of appearance."""
+    if not text or "://" not in text:  # Cheap reject for the common case of plain chat
+        return []
+    return [url for url in map(_classify, URL_PATTERN.finditer(text)) if url]
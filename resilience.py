@@ -0,0 +1,196 @@
+# resilience.py
+
+import asyncio
+import logging
+import os
+import random
+import time
+import aiohttp
+import requests
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+
+# Consecutive transient failures that open a platform's circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+# Seconds an open circuit waits before letting a probe request through
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 60))
+# Attempts per scrape, the first one included
+SCRAPE_MAX_ATTEMPTS = int(os.getenv("SCRAPE_MAX_ATTEMPTS", 3))
+# Base delay before a retry, doubled per attempt and jittered
+SCRAPE_RETRY_DELAY = float(os.getenv("SCRAPE_RETRY_DELAY", 1))
+# Retries allowed per sweep, as a share of the scrapes made, with a floor for small sweeps
+SCRAPE_RETRY_BUDGET = float(os.getenv("SCRAPE_RETRY_BUDGET", 0.1))
+SCRAPE_RETRY_MIN = int(os.getenv("SCRAPE_RETRY_MIN", 10))
+
+# Page text that means we were served a block page instead of the product
+BLOCK_MARKERS = ("captcha", "robot check", "access denied", "too many requests", "service unavailable")
+
+
+class ScrapeError(Exception):
+    pass
+
+
+class TransientScrapeError(ScrapeError):
+    """Worth retrying later: network trouble, throttling, block pages."""
+
+
+class PermanentScrapeError(ScrapeError):
+    """Retrying will not help: the page is not a product page we can parse."""
+
+
+class BlockedError(TransientScrapeError):
+    pass
+
+
+class CircuitOpenError(TransientScrapeError):
+    def __init__(self, platform, retry_after):
+        super().__init__(f"{platform} circuit is open, retry in {retry_after:.0f}s")
+        self.platform = platform
+        self.retry_after = retry_after
+
+
+def is_transient(error):
+    """Classify a scrape failure; unknown errors count as permanent so they are not retried blindly."""
+    if isinstance(error, ScrapeError):
+        return isinstance(error, TransientScrapeError)
+    return isinstance(error, (asyncio.TimeoutError, requests.RequestException, aiohttp.ClientError, OSError))
+
+
+def looks_blocked(soup):
+    """Whether a fetched page is a captcha or rate-limit page rather than a real (or missing) product."""
+    title = soup.title.get_text(" ", strip=True).lower() if soup.title else ""
+    if not title and not soup.get_text(strip=True):
+        return True  # Empty response
+    text = title + " " + soup.get_text(" ", strip=True)[:2000].lower()
+    return any(marker in text for marker in BLOCK_MARKERS)
+
+
+class CircuitBreaker:
+    """Closed, open or half-open; stops calls to a platform after repeated transient failures.
+
+    While open every call fails fast with CircuitOpenError. After `reset_timeout` a single
+    probe is let through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.probing = False
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go out now."""
+        if self.state == "open" and not self.retry_after():
+            self.state = "half_open"
+            logging.info("%s circuit half-open, sending a probe", self.name)
+        if self.state == "closed" or (self.state == "half_open" and not self.probing):
+            self.probing = self.state == "half_open"
+            return
+        self.rejected += 1
+        raise CircuitOpenError(self.name, self.retry_after() or self.reset_timeout)
+
+    def is_open(self):
+        return self.state == "open" and self.retry_after() > 0
+
+    def record_success(self):
+        if self.state != "closed":
+            logging.info("%s circuit closed", self.name)
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logging.warning("%s circuit opened after %s failures", self.name, self.failures)
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Caps retries at a share of all attempts so an outage cannot multiply the load."""
+
+    def __init__(self, ratio=SCRAPE_RETRY_BUDGET, minimum=SCRAPE_RETRY_MIN):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.reset()
+
+    def reset(self):
+        self.attempts = 0
+        self.retries = 0
+        self.denied = 0
+
+    def record_attempt(self):
+        self.attempts += 1
+
+    def try_spend(self):
+        if self.retries < max(self.minimum, self.ratio * self.attempts):
+            self.retries += 1
+            return True
+        self.denied += 1
+        return False
+
+
+breakers = {}
+retry_budget = RetryBudget()
+
+metrics.Gauge(
+    "pricetracker_circuit_open", "1 while a platform's circuit breaker stops scrapes", ("platform",),
+    callback=lambda: {(name,): int(breaker.state != "closed") for name, breaker in list(breakers.items())},
+)
+
+
+def get_breaker(platform):
+    if platform not in breakers:
+        breakers[platform] = CircuitBreaker(platform)
+    return breakers[platform]
+
+
+def start_sweep():
+    """Give the next sweep a fresh retry budget."""
+    retry_budget.reset()
+
+
+def summary():
+    circuits = ", ".join(
+        f"{name}: {breaker.state} ({breaker.rejected} rejected)" for name, breaker in sorted(breakers.items())
+    )
+    return (
+        f"Retries {retry_budget.retries} used, {retry_budget.denied} denied over {retry_budget.attempts} attempts"
+        f"{' [' + circuits + ']' if circuits else ''}"
+    )
+
+
+async def call(platform, func, *args):
+    """Await `func(*args)` behind the platform's circuit breaker, retrying transient errors within the budget."""
+    breaker = get_breaker(platform)
+    for attempt in range(1, SCRAPE_MAX_ATTEMPTS + 1):
+        breaker.allow()
+        retry_budget.record_attempt()
+        try:
+            result = await func(*args)
+        except Exception as e:
+            if not is_transient(e):
+                breaker.record_success()  # The platform answered; this page is just unusable
+                raise
+            breaker.record_failure()
+            if attempt == SCRAPE_MAX_ATTEMPTS or breaker.is_open() or not retry_budget.try_spend():
+                raise
+            delay = SCRAPE_RETRY_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            logging.warning("Transient %s error (%s), retry %s in %.1fs", platform, e, attempt, delay)
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
@@ -2,112 +2,253 @@
 
 import time
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
+import datetime
 import os
-from scraper import scrape
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from scraper import scrape_if_changed, parse_price
+import fetcher
+from sweep import run_sweep
 from dotenv import load_dotenv
 import logging
-from helpers import fetch_all_products
+from history import PRICE_HISTORY, history_update, history_observation, bucket_day, downsample_history
+from adaptive import schedule_fields, CHECK_INTERVAL_MIN
+import events
+import leases
+import resilience
+import metrics
+from helpers import PRODUCTS
+from prices import is_available
 
 load_dotenv()
 
-# Database Connection
-dbclient = AsyncIOMotorClient(os.getenv("MONGO_URI"))
-database = dbclient[os.getenv("DATABASE")]
-PRODUCTS = database[os.getenv("PRODUCTS")]
+# Number of price updates sent to Mongo in one bulk_write
+PRICE_UPDATE_BATCH_SIZE = int(os.getenv("PRICE_UPDATE_BATCH_SIZE", 500))
+# Longest a scraped price waits in a batch before it is written (and its alert sent), in seconds
+PRICE_UPDATE_FLUSH_INTERVAL = float(os.getenv("PRICE_UPDATE_FLUSH_INTERVAL", 10))
+# Bounds for the pause between two rounds of due products (seconds)
+DUE_POLL_MIN = float(os.getenv("DUE_POLL_MIN", 5))
+DUE_POLL_MAX = float(os.getenv("DUE_POLL_MAX", CHECK_INTERVAL_MIN))
 
-async def check_prices(app):
-    """Check the prices of products and update if changed."""
-    print("Checking Prices for Products...")
-    changed_products = []
 
-    async for product in PRODUCTS.find():
-        try:
-            platform = "amazon" if "amazon" in product["url"] else "flipkart"
-            product_name, current_price, availability, image_url = await scrape(product["url"], platform)
+def due_products_query(now):
+    """Products whose next check time has passed, including ones never scheduled."""
+    return {"$or": [{"next_check_at": {"$lte": now}}, {"next_check_at": None}]}
 
-            if current_price != product["price"]:
-                await update_product_in_db(product, current_price)
-                changed_products.append(product["_id"])
-        except Exception as e:
-            logging.error(f"Error scraping product {product['url']}: {e}")
-        await asyncio.sleep(1)
-
-    print("Completed")
-    await notify_users(changed_products, app)
-
-async def update_product_in_db(product, current_price):
-    """Update product details in the database."""
-    await PRODUCTS.update_one(
-        {"_id": product["_id"]},
-        {
-            "$set": {
-                "price": current_price,
-                "previous_price": product["price"],
-                "lower": min(current_price, product["lower"]),
-                "upper": max(current_price, product["upper"]),
-            }
-        },
-    )
 
-async def notify_users(changed_products, app):
-    """Notify users of price changes."""
-    for changed_product in changed_products:
-        global_product = await PRODUCTS.find_one({"_id": changed_product})
-        if global_product:
-            price_change, change_type = calculate_price_change(global_product)
-
-            # Notify the user if there is a price change
-            if price_change > 0:
-                if change_type == "increased":
-                    message = (
-                        f"🚨 The price of **{global_product['product_name']}** has **increased** by ₹{price_change}.\n"
-                        f"   - Previous Price: ₹{global_product['previous_price']}\n"
-                        f"   - Current Price: ₹{global_product['price']}\n"
-                        f"   - [Check it out here]({global_product['affiliate_url']})"
-                    )
-                elif change_type == "decreased":
-                    message = (
-                        f"🎉 The price of **{global_product['product_name']}** has **decreased** by ₹{price_change}.\n"
-                        f"   - Previous Price: ₹{global_product['previous_price']}\n"
-                        f"   - Current Price: ₹{global_product['price']}\n"
-                        f"   - [Check it out here]({global_product['affiliate_url']})"
-                    )
-
-                user_products = await fetch_all_products(global_product["_id"])
-                for user in user_products:
-                    await app.send_message(chat_id=user["user_id"], text=message, disable_web_page_preview=True)
-
-def calculate_price_change(product):
-    """Calculate the absolute price change and determine if the price increased or decreased."""
-    try:
-        # Convert price and previous_price to floats for arithmetic operation
-        current_price = float(product["price"])
-        previous_price = float(product["previous_price"])
-
-        # Calculate the absolute change
-        price_difference = current_price - previous_price
-
-        # Determine if price increased or decreased
-        if price_difference > 0:
-            return abs(price_difference), "increased"
-        elif price_difference < 0:
-            return abs(price_difference), "decreased"
+async def check_prices():
+    """Check the prices of the products that are due and update if changed."""
+    def prices_written(changed):
+        # Instant alerts go out as soon as each batch of new prices is written, not at the end of the sweep
+        events.publish(events.PRICE_CHANGED, changed)
+
+    updates = BulkWriteBatch(PRODUCTS, on_flush=prices_written)
+    history = BulkWriteBatch(PRICE_HISTORY)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    # Stored as an ISO date string: Motor hands datetimes back naive, which never equal an aware one
+    today = bucket_day(now).date().isoformat()
+
+    price_changes = 0
+
+    async def observe_price(product, schedule):
+        """Record an unchanged price once a day, so the history covers periods without changes."""
+        price = parse_price(product.get("price"))
+        if is_available(price) and product.get("history_day") != today:
+            await history.add(history_observation(product["_id"], price))
+            schedule["history_day"] = today
+
+    async def check_product(product, platform):
+        started = time.perf_counter()
+        try:
+            result, fetch_state = await scrape_if_changed(product["url"], platform, product.get("fetch"))
+        except resilience.CircuitOpenError as e:
+            # The platform is down, not this product: look again once the circuit may have closed
+            metrics.SCRAPE_SECONDS.observe(time.perf_counter() - started, platform=platform, result="skipped")
+            retry_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=e.retry_after)
+            await updates.add(schedule_update(product, {"next_check_at": retry_at}))
+            return
+        except Exception:
+            # Back off before trying this product again
+            metrics.SCRAPE_SECONDS.observe(time.perf_counter() - started, platform=platform, result="failed")
+            await updates.add(schedule_update(product, schedule_fields(product, failed=True)))
+            raise
+
+        product_name, current_price, availability, image_url = result or (None, None, None, None)
+        changed = result is not None and current_price != parse_price(product["price"])
+        outcome = "changed" if changed else "unchanged"
+        metrics.SCRAPE_SECONDS.observe(time.perf_counter() - started, platform=platform, result=outcome)
+
+        if result is None:
+            # Not modified, or nothing around the price changed: no parse, no price write
+            schedule = {**schedule_fields(product), "fetch": fetch_state}
+            await observe_price(product, schedule)
+            await updates.add(schedule_update(product, schedule))
+            return
+
+        schedule = {**schedule_fields(product, changed=changed), "fetch": fetch_state}
+        if changed:
+            nonlocal price_changes
+            price_changes += 1
+            metrics.PRICE_CHANGES.inc()
+            if is_available(current_price):
+                await history.add(history_update(product["_id"], current_price))
+                schedule["history_day"] = today
+            await updates.add(price_update(product, current_price, schedule), changed=leases.owned(product))
         else:
-            return 0, "no change"  # No change in price
-
-    except (ValueError, TypeError) as e:
-        logging.error(f"Error calculating price change: {e}") 
-        return 0, "error"
-
-
-async def compare_prices():
-    """Compare current and previous prices of products."""
-    print("Comparing Prices...")
-    product_with_changes = []
-    async for product in PRODUCTS.find():
-        current_price = product.get("price")
-        previous_price = product.get("previous_price")
-        if current_price != previous_price:
-            product_with_changes.append(product.get("_id"))
-    return product_with_changes
+            await observe_price(product, schedule)
+            await updates.add(schedule_update(product, schedule))
+
+    # Products are leased before they are scraped, so several processes can sweep side by side;
+    # the next_check_at index doubles as the priority queue: most overdue first
+    backlog = await PRODUCTS.count_documents(due_products_query(now))
+    metrics.SWEEP_BACKLOG.set(backlog)
+    logging.info("Checking prices of %s due products", backlog)
+    due = leases.claim_due_products(PRODUCTS, due_products_query(now))
+    resilience.start_sweep()
+    fetcher.stats.reset()
+    # Products of a platform whose circuit is open are skipped without waiting on the host rate limit
+    report = await run_sweep(
+        due, check_product, platform_available=lambda platform: not resilience.get_breaker(platform).is_open()
+    )
+    await updates.flush()
+    await history.flush()
+    await downsample_history()
+    metrics.SWEEP_SECONDS.observe(report.duration)
+    for platform, processed in report.processed.items():
+        metrics.SWEEP_PRODUCTS.inc(processed - report.failed[platform], platform=platform, outcome="ok")
+        metrics.SWEEP_PRODUCTS.inc(report.failed[platform], platform=platform, outcome="failed")
+
+    await events.drain()  # Let the alerts of the last batch go out before the sweep counts as done
+    # One line per sweep instead of one per product; the fields are also structured for LOG_FORMAT=json
+    logging.info(
+        "%s, %s price changes. %s. %s",
+        report.summary(), price_changes, resilience.summary(), fetcher.stats.summary(),
+        extra={"sweep": {
+            "due": backlog,
+            "products": report.total,
+            "failures": report.failures,
+            "price_changes": price_changes,
+            "seconds": round(report.duration, 2),
+            "retries": resilience.retry_budget.retries,
+            "fetched": fetcher.stats.requests,
+            "parsed": fetcher.stats.parsed,
+        }},
+    )
+
+async def seconds_until_next_check():
+    """How long the scheduler can sleep before the next product becomes due."""
+    upcoming = await PRODUCTS.find_one(
+        {"next_check_at": {"$ne": None}}, {"next_check_at": 1}, sort=[("next_check_at", 1)]
+    )
+    if not upcoming:
+        return DUE_POLL_MAX
+    next_check_at = upcoming["next_check_at"]
+    if next_check_at.tzinfo is None:  # Motor returns naive UTC datetimes
+        next_check_at = next_check_at.replace(tzinfo=datetime.timezone.utc)
+    wait = (next_check_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    return min(DUE_POLL_MAX, max(DUE_POLL_MIN, wait))
+
+def price_update(product, current_price, schedule=None):
+    """Build the write for one changed product; upper and lower are kept by Mongo with $max/$min."""
+    update = {
+        "$set": {
+            "price": current_price,
+            "previous_price": product["price"],
+            **(schedule or {}),
+        },
+        "$unset": leases.RELEASE,
+    }
+    if not is_available(current_price):
+        return UpdateOne(leases.owned(product), update)  # The price range only covers real prices
+    # Older documents stored scraped prices as strings, which $max/$min would compare as text
+    if isinstance(product.get("upper"), (int, float)):
+        update["$max"] = {"upper": current_price}
+    else:
+        update["$set"]["upper"] = max(parse_price(product.get("upper")), current_price)
+    lower = product.get("lower")
+    if isinstance(lower, (int, float)) and is_available(lower):
+        update["$min"] = {"lower": current_price}
+    else:
+        # Also replaces a low of 0 recorded before out-of-stock prices were left out
+        lower = parse_price(lower)
+        update["$set"]["lower"] = min(lower, current_price) if is_available(lower) else current_price
+    return UpdateOne(leases.owned(product), update)
+
+def schedule_update(product, schedule):
+    """Write the next check time of a product whose price did not change, releasing its lease."""
+    return UpdateOne(leases.owned(product), {"$set": schedule, "$unset": leases.RELEASE})
+
+class BulkWriteBatch:
+    """Collects writes during a sweep and sends them with unordered bulk_write calls.
+
+    Operations added with `changed=<filter of the written document>` report that
+    document's id to `on_flush` once their batch has been written, leaving out any
+    that Mongo rejected or that matched nothing (e.g. a product whose lease was lost).
+    A batch is written once it is full, or by a timer `flush_interval` seconds after
+    its first operation, however slowly the following ones arrive.
+    """
+
+    def __init__(self, collection, batch_size=None, flush_interval=None, on_flush=None):
+        self.collection = collection
+        self.batch_size = batch_size or PRICE_UPDATE_BATCH_SIZE
+        self.flush_interval = flush_interval or PRICE_UPDATE_FLUSH_INTERVAL
+        self.on_flush = on_flush
+        self.pending = []
+        self.changed = []
+        self._timer = None
+        self._timed_writes = set()
+
+    async def add(self, operation, changed=None):
+        if not self.pending and self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        if changed is not None:
+            self.changed.append((len(self.pending), changed))
+        self.pending.append(operation)
+        if len(self.pending) >= self.batch_size:
+            await self._write()
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        # From here on this task is a write that flush() waits for, not a timer it may cancel
+        self._timer = None
+        task = asyncio.current_task()
+        self._timed_writes.add(task)
+        try:
+            await self._write()
+        except Exception as e:
+            logging.error("Timed bulk write to %s failed: %s", self.collection.name, e)
+        finally:
+            self._timed_writes.discard(task)
+
+    async def flush(self):
+        """Write whatever is pending and wait for timed writes already under way."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self._write()
+        if self._timed_writes:
+            await asyncio.gather(*self._timed_writes)
+
+    async def _write(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        changed, self.changed = self.changed, []
+        failed = set()
+        try:
+            result = await self.collection.bulk_write(batch, ordered=False)
+            matched = result.matched_count
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            matched = e.details.get("nMatched", 0)
+            logging.error(
+                "Bulk write to %s failed for %s of %s operations",
+                self.collection.name, len(failed), len(batch),
+            )
+        written = [item for index, item in changed if index not in failed]
+        if not written or not self.on_flush:
+            return
+        if matched < len(batch) - len(failed):
+            # Some filters matched nothing; keep only the changes that really were written
+            written = [item async for item in self.collection.find({"$or": written}, {"_id": 1})]
+        self.on_flush([item["_id"] for item in written])
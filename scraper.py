@@ -1,32 +1,94 @@
 #scraper.py
 
-from amazon import track_prices
+from amazon import track_prices, extract_product
 from python_flipkart_scraper import ExtractFlipkart
+from executor import run_blocking
+import resilience
+import fetcher
+import fast_extract
+from prices import UNAVAILABLE
+from resilience import BlockedError, PermanentScrapeError, looks_blocked
 import logging
-async def scrape(url, platform):
+import logs
+
+
+def parse_price(price):
+    """Turn a scraped price such as "₹1,299" or "1299.50" into a number (0 when missing)."""
+    if isinstance(price, (int, float)):
+        return price
+    cleaned = str(price or "").replace("₹", "").replace(",", "").strip()
+    try:
+        value = float(cleaned)
+    except ValueError:
+        return 0
+    return int(value) if value.is_integer() else value
+
+
+# Blocking extraction, runs on the scrape pool (see executor.py); parses `html` when it was already fetched
+def extract_flipkart(url, html=None):
+    product = ExtractFlipkart(url) if html is None else fetcher.extractor_from_html(ExtractFlipkart, html)
+    product_name = product.get_title()
+    if not product_name:
+        # The scraper returns blanks instead of failing; a page without a title is no product page
+        if looks_blocked(product.soup):
+            raise BlockedError(f"Flipkart served a block page for {url}")
+        raise PermanentScrapeError(f"No product title found on {url}")
+    in_stock = product.is_available()
+    price = product.get_price() if in_stock else UNAVAILABLE
+    availability = "In Stock" if in_stock else "Out of Stock"
+    images = product.get_images()
+    return product_name, price, availability, images
+
+
+async def scrape(url, platform, html=None):
     if platform == "amazon":
         # Scrape Amazon product details
-        price, product_name, availability, images = await track_prices(url)
+        if html is None:
+            price, product_name, availability, images = await track_prices(url)
+        else:
+            price, product_name, availability, images = await run_blocking(extract_product, url, html)
         
-        # If the product is unavailable on Amazon, set price to 0
         if not availability:
-            price = 0  # Use 0 as placeholder for unavailable products
+            price = UNAVAILABLE
+        price = parse_price(price)
 
-        logging.info(f"Amazon Product: {product_name}, Price: {price}, Availability: {availability}")
+        logs.sampled(logging.INFO, "Amazon Product: %s, Price: %s, Availability: %s", product_name, price, availability)
         
         return product_name, price, availability, images[0] if images else None
     
     elif platform == "flipkart":
         # Scrape Flipkart product details
-        product = ExtractFlipkart(url)
-        product_name = product.get_title()
-        price = product.get_price() if product.is_available() else 0  # Set price to 0 if unavailable
-        availability = "In Stock" if product.is_available() else "Out of Stock"
-        images = product.get_images()
+        if html is None:
+            product_name, price, availability, images = await resilience.call("flipkart", run_blocking, extract_flipkart, url)
+        else:
+            product_name, price, availability, images = await run_blocking(extract_flipkart, url, html)
+        price = parse_price(price)
 
-        logging.info(f"Flipkart Product: {product_name}, Price: {price}, Availability: {availability}")
+        logs.sampled(logging.INFO, "Flipkart Product: %s, Price: %s, Availability: %s", product_name, price, availability)
 
         return product_name, price, availability, images[0] if images else None
     
     else:
         raise ValueError("Unsupported platform")
+
+
+async def scrape_if_changed(url, platform, state=None):
+    """Scrape a product only if its page changed since the fetch `state` stored with it.
+
+    Returns (scrape result or None when unchanged, fetch state to store for next time).
+    Only price and availability are guaranteed: when the fast extractor finds them the
+    name and image are None.
+    """
+    if not fetcher.CONDITIONAL_FETCH:
+        return await scrape(url, platform), state
+    if platform not in ("amazon", "flipkart"):
+        raise ValueError("Unsupported platform")
+    page = await resilience.call(platform, fetcher.fetch, url, platform, state)
+    if not page.changed:
+        return None, page.state
+    quick = await run_blocking(fast_extract.extract, platform, page.html)
+    if quick is None:
+        return await scrape(url, platform, page.html), page.state
+    fetcher.stats.fast += 1
+    price, availability = quick
+    return (None, parse_price(price) if availability else 0, availability, None), page.state
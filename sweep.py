@@ -0,0 +1,146 @@
+# sweep.py
+
+import asyncio
+import logging
+import os
+import time
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from regex_patterns import classify_url
+
+load_dotenv()
+
+
+PLATFORMS = ("amazon", "flipkart")
+
+# Number of concurrent scrape workers per platform
+DEFAULT_WORKERS = {
+    "amazon": int(os.getenv("SWEEP_WORKERS_AMAZON", 4)),
+    "flipkart": int(os.getenv("SWEEP_WORKERS_FLIPKART", 4)),
+}
+
+# Maximum requests per second sent to a single host (replaces the flat sleep)
+HOST_RATE_LIMIT = float(os.getenv("SWEEP_HOST_RATE_LIMIT", 2))
+
+
+def product_platform(product):
+    """Platform of a global product document; older documents without one are classified by URL."""
+    if product.get("platform"):
+        return product["platform"]
+    match = classify_url(product["url"])
+    return match.platform if match else "flipkart"
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host so each host sees at most `rate` requests per second."""
+
+    def __init__(self, rate=HOST_RATE_LIMIT):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next_slot = {}
+
+    async def acquire(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc.lower()
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class SweepReport:
+    """Counters collected during one sweep over the products collection."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.processed = {platform: 0 for platform in PLATFORMS}
+        self.failed = {platform: 0 for platform in PLATFORMS}
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+    @property
+    def duration(self):
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def total(self):
+        return sum(self.processed.values())
+
+    @property
+    def failures(self):
+        return sum(self.failed.values())
+
+    @property
+    def products_per_sec(self):
+        return self.total / self.duration if self.duration > 0 else 0.0
+
+    def summary(self):
+        per_platform = ", ".join(
+            f"{platform}: {self.processed[platform]} ({self.failed[platform]} failed)" for platform in PLATFORMS
+        )
+        return (
+            f"Sweep finished in {self.duration:.1f}s - {self.total} products, "
+            f"{self.products_per_sec:.2f} products/sec, {self.failures} failures [{per_platform}]"
+        )
+
+
+async def run_sweep(products, check_product, workers=None, rate_limiter=None, platform_available=None):
+    """Run `check_product` over every product with a bounded pool of workers per platform.
+
+    `products` may be a regular or an async iterable (e.g. a Motor cursor). Each platform gets
+    its own queue and workers so a slow platform cannot starve the other one. When
+    `platform_available(platform)` is false no request will go out, so the host rate limit is skipped.
+    """
+    workers = {**DEFAULT_WORKERS, **(workers or {})}
+    rate_limiter = rate_limiter or HostRateLimiter()
+    report = SweepReport()
+
+    queues = {platform: asyncio.Queue(maxsize=workers[platform] * 2) for platform in PLATFORMS}
+
+    async def worker(platform):
+        queue = queues[platform]
+        while True:
+            product = await queue.get()
+            try:
+                if product is None:
+                    return
+                if platform_available is None or platform_available(platform):
+                    await rate_limiter.acquire(product["url"])
+                await check_product(product, platform)
+            except Exception as e:
+                report.failed[platform] += 1
+                logging.error("Error scraping product %s: %s", product['url'], e)
+            finally:
+                if product is not None:
+                    report.processed[platform] += 1
+                queue.task_done()
+
+    tasks = [
+        asyncio.create_task(worker(platform))
+        for platform in PLATFORMS
+        for _ in range(max(1, workers[platform]))
+    ]
+
+    try:
+        if hasattr(products, "__aiter__"):
+            async for product in products:
+                await queues[product_platform(product)].put(product)
+        else:
+            for product in products:
+                await queues[product_platform(product)].put(product)
+
+        # One stop marker per worker
+        for platform in PLATFORMS:
+            for _ in range(max(1, workers[platform])):
+                await queues[platform].put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    report.finish()
+    return report
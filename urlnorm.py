@@ -0,0 +1,40 @@
+# urlnorm.py
+
+import re
+from urllib.parse import urlparse, parse_qs
+from regex_patterns import classify_url
+
+
+# Amazon product URLs carry the 10 character ASIN after one of these path segments
+ASIN_PATTERN = re.compile(r"/(?:dp|gp/product|gp/aw/d|exec/obidos/asin|o/asin)/([A-Z0-9]{10})(?:[/?#]|$)", re.IGNORECASE)
+# Flipkart item ids look like /p/itm0123abcd...; the pid query parameter is more specific when present
+FLIPKART_ITEM_PATTERN = re.compile(r"/p/(itm[0-9a-z]+)", re.IGNORECASE)
+
+
+def url_platform(url):
+    """"amazon" or "flipkart" for a URL on a supported host, else None."""
+    match = classify_url(url)
+    return match.platform if match else None
+
+
+def product_key(url):
+    """Extract a stable (platform, key) pair from an expanded product URL, or None.
+
+    The key is the ASIN for Amazon and the pid (or the itm id) for Flipkart. Short links
+    have to be expanded first, they carry neither.
+    """
+    match = classify_url(url)
+    if match is None or match.is_short:
+        return None
+    parsed = urlparse(url)
+
+    if match.platform == "amazon":
+        match = ASIN_PATTERN.search(parsed.path)
+        return ("amazon", match.group(1).upper()) if match else None
+
+    pid = parse_qs(parsed.query).get("pid")
+    if pid and pid[0]:
+        return "flipkart", pid[0].upper()
+    match = FLIPKART_ITEM_PATTERN.search(parsed.path)
+    return ("flipkart", match.group(1).lower()) if match else None
+
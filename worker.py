@@ -0,0 +1,57 @@
+# worker.py
+#
+# Scrape worker for the split deployment (see README): sweeps the due products and
+# queues a price alert job for notifier.py after every batch of new prices. Start as
+# many as needed; products are leased, so no two workers check the same one.
+
+import asyncio
+import logs
+from dotenv import load_dotenv
+import events
+import executor
+import http_client
+import db
+import jobs
+import metrics
+from scheduler import check_prices, seconds_until_next_check
+from migrations import migrate_product_keys
+from indexes import ensure_indexes
+
+load_dotenv()
+
+
+async def prepare_database():
+    await migrate_product_keys()  # Backfill product keys so the unique index can be built.
+    await ensure_indexes()  # Create every declared index before the first sweep.
+
+
+async def sweep_forever():
+    await prepare_database()
+    while True:
+        await check_prices()  # Check the products that are due.
+        await asyncio.sleep(await seconds_until_next_check())  # Sleep until the next product is due.
+
+
+async def queue_price_alerts(changed_products):
+    await jobs.enqueue(jobs.PRICE_ALERT, {"product_ids": changed_products})
+
+
+async def run():
+    await db.connect()  # Shared Mongo client; fails fast if the database is unreachable.
+    metrics.serve()  # /metrics, when METRICS_PORT is set.
+    events.subscribe(events.PRICE_CHANGED, queue_price_alerts)
+    try:
+        await sweep_forever()
+    finally:
+        await http_client.close()
+        executor.shutdown()  # Stop the scrape pool.
+        db.close()
+
+
+def main():
+    logs.setup()
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()